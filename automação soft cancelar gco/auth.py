@@ -1,13 +1,67 @@
 from playwright.sync_api import Page
 import config
+import json
 import time
 import os
 
+# Sessão autenticada salva (cookies + localStorage) e tempo máximo da sondagem
+ARQUIVO_SESSAO = getattr(config, "ARQUIVO_SESSAO", os.path.abspath("./sessao_softexpert.json"))
+TIMEOUT_SONDA = getattr(config, "TIMEOUT_SONDA_SESSAO", 15000)
+
 class Autenticador:
     def __init__(self, page: Page):
         self.page = page
 
+    # --- SESSÃO SALVA ---
+    def carregar_sessao(self):
+        """Injeta os cookies salvos no contexto (inclusive os de sessão, que o perfil perde ao fechar)."""
+        if not os.path.exists(ARQUIVO_SESSAO):
+            return False
+        try:
+            with open(ARQUIVO_SESSAO, encoding="utf-8") as f:
+                estado = json.load(f)
+            self.page.context.add_cookies(estado.get("cookies", []))
+            return True
+        except Exception as e:
+            print(f"--> [AVISO] Sessão salva ignorada: {e}")
+            return False
+
+    def salvar_sessao(self):
+        try:
+            self.page.context.storage_state(path=ARQUIVO_SESSAO)
+            print(f"--> [SESSÃO] Estado autenticado salvo em '{ARQUIVO_SESSAO}'.")
+        except Exception as e:
+            print(f"--> [AVISO] Não foi possível salvar a sessão: {e}")
+
+    def sessao_valida(self, timeout=TIMEOUT_SONDA):
+        """
+        Sondagem rápida: abre a página e espera o que aparecer primeiro,
+        a barra de pesquisa (logado) ou o campo de usuário (deslogado).
+        """
+        try:
+            self.page.goto(config.URL_LOGIN, wait_until="commit")
+            self.page.locator(f"{config.SEL_BARRA_PESQUISA}, {config.SEL_CAMPO_USUARIO}").first.wait_for(
+                state="visible", timeout=timeout
+            )
+            return self.page.is_visible(config.SEL_BARRA_PESQUISA)
+        except Exception:
+            return False
+
     def realizar_login(self):
+        # 1. Caminho rápido: sessão salva/perfil ainda logado
+        inicio = time.time()
+        self.carregar_sessao()
+        if self.sessao_valida():
+            print(f"--> [LOGIN] Sessão ativa reaproveitada ({time.time() - inicio:.1f}s).")
+            self.salvar_sessao()
+            return True
+
+        print("--> [LOGIN] Sessão inválida ou expirada. Fazendo login completo...")
+        self._login_completo()
+        self.salvar_sessao()
+        return True
+
+    def _login_completo(self):
         print("--> [LOGIN] Acessando página inicial...")
         
         try:
@@ -0,0 +1,139 @@
+import time
+import config
+from playwright.sync_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeout
+
+# --- ESPERAS POR SINAIS REAIS (NO LUGAR DE time.sleep FIXO) ---
+# Cada espera termina assim que o sinal chega (resposta XHR, linhas da grid,
+# formulário do popup) e tem um teto por etapa: se o sinal não vier, o fluxo
+# segue como antes (as buscas seguintes ainda tentam dentro do próprio limite).
+
+# Trecho da URL da requisição que recarrega a grid. Sem ele, a espera pela grid é pela
+# mudança real do DOM (linhas, primeira linha, mensagem de vazio), nunca por "qualquer XHR"
+PADRAO_XHR_GRID = getattr(config, "PADRAO_XHR_GRID", None)
+TIMEOUT_XHR = getattr(config, "TIMEOUT_XHR_GRID", 15000)  # ms
+# Linhas da grid (mesma estrutura usada para achar a linha de um item)
+SEL_LINHAS_GRID = "tr, div[class*='row'], div[class*='Row']"
+MSG_GRID_VAZIA = "Não encontramos nenhum resultado"
+
+# Retrato da grid num frame: [linhas, texto da 1ª linha, mensagem de vazio visível, 1ª linha é o
+# mesmo nó marcado antes da ação]. O nó marcado pega a grid redesenhada com o mesmo conteúdo.
+JS_ASSINATURA_GRID = """
+([seletor, mensagem, marcar]) => {
+    const linhas = Array.from(document.querySelectorAll(seletor)).filter(l => !l.querySelector(seletor));
+    const primeira = linhas.length ? linhas[0] : null;
+    if (marcar) window.__roboPrimeiraLinha = primeira;
+    const aviso = document.evaluate(
+        `//*[contains(text(), "${mensagem}")]`, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+    ).singleNodeValue;
+    return [
+        linhas.length,
+        primeira ? primeira.innerText : "",
+        !!aviso && aviso.offsetParent !== null,
+        primeira !== null && primeira === window.__roboPrimeiraLinha,
+    ];
+}
+"""
+
+
+def _eh_xhr(padrao):
+    def predicado(response):
+        if response.request.resource_type not in ("xhr", "fetch"):
+            return False
+        return padrao is None or padrao in response.url
+    return predicado
+
+def executar_e_aguardar_xhr(page, acao, timeout=TIMEOUT_XHR, padrao=None):
+    """
+    Executa a ação (clique, Enter...) e espera a resposta XHR que ela dispara ('padrao' = trecho
+    da URL; None = qualquer XHR, só para ações de um popup). Para a grid, use executar_e_aguardar_grid.
+    False = estourou o teto ou a página fechou depois da ação; erro da própria ação sobe.
+    """
+    acao_feita = False
+    try:
+        with page.expect_response(_eh_xhr(padrao), timeout=timeout):
+            acao()
+            acao_feita = True
+        return True
+    except PlaywrightError:
+        if not acao_feita:
+            raise
+        return False
+
+def assinatura_grid(page, marcar=False, seletor=SEL_LINHAS_GRID):
+    assinatura = []
+    for frame in page.frames:
+        try:
+            assinatura.append(tuple(frame.evaluate(JS_ASSINATURA_GRID, [seletor, MSG_GRID_VAZIA, marcar])))
+        except Exception:
+            assinatura.append(None)  # Frame navegando/removido
+    return assinatura
+
+def executar_e_aguardar_grid(page, acao, timeout=TIMEOUT_XHR):
+    """
+    Executa a ação e espera a grid recarregar: pela resposta XHR da grid (PADRAO_XHR_GRID) ou,
+    sem o padrão configurado, pela mudança do retrato da grid no DOM. False = teto estourado.
+    """
+    if PADRAO_XHR_GRID:
+        return executar_e_aguardar_xhr(page, acao, timeout, PADRAO_XHR_GRID)
+
+    anterior = assinatura_grid(page, marcar=True)
+    acao()
+    return aguardar_condicao(lambda: assinatura_grid(page) != anterior, timeout / 1000) is not None
+
+def pesquisar(page, barra, termo, timeout=TIMEOUT_XHR):
+    """Limpa a barra, digita o termo e espera a grid responder ao Enter."""
+    barra.click()
+    barra.press("Control+A")
+    barra.press("Backspace")
+    barra.fill(termo)
+    return executar_e_aguardar_grid(page, lambda: barra.press("Enter"), timeout)
+
+def aguardar_condicao(condicao, timeout_s, intervalo_s=0.2):
+    """Repete 'condicao()' até devolver algo verdadeiro (que é retornado) ou até o teto (None)."""
+    limite = time.monotonic() + timeout_s
+    while True:
+        resultado = condicao()
+        if resultado:
+            return resultado
+        if time.monotonic() >= limite:
+            return None
+        time.sleep(intervalo_s)
+
+def contar_linhas(page, seletor=SEL_LINHAS_GRID):
+    total = 0
+    for frame in page.frames:
+        try:
+            total += frame.locator(seletor).count()
+        except Exception:
+            continue
+    return total
+
+def aguardar_mudanca_linhas(page, contagem_anterior, timeout_s, seletor=SEL_LINHAS_GRID):
+    """Espera a quantidade de linhas da grid mudar (rolagem/paginação carregou mais itens)."""
+    return aguardar_condicao(lambda: contar_linhas(page, seletor) != contagem_anterior, timeout_s)
+
+def aguardar_popup_pronto(popup, seletor, timeout=TIMEOUT_XHR):
+    """Popup pronto = DOM carregado e o campo/controle do formulário visível."""
+    popup.wait_for_load_state("domcontentloaded")
+    popup.locator(seletor).first.wait_for(state="visible", timeout=timeout)
+
+def aguardar_conclusao_popup(popup, alvo, timeout=TIMEOUT_XHR):
+    """
+    Ação do popup concluída = o controle clicado sumiu (o formulário avançou) ou o
+    popup fechou sozinho. False = nada disso dentro do teto.
+    """
+    try:
+        alvo.wait_for(state="hidden", timeout=timeout)
+        return True
+    except PlaywrightTimeout:
+        return False
+    except PlaywrightError:
+        return popup.is_closed()
+
+def aguardar_fechamento(popup, timeout=TIMEOUT_XHR):
+    """Espera o popup fechar sozinho após confirmar (True) ou o teto (False)."""
+    try:
+        popup.wait_for_event("close", timeout=timeout)
+        return True
+    except PlaywrightTimeout:
+        return False
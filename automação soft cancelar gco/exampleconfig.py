@@ -7,6 +7,10 @@ import os
 
 # --- PERFIL ---
 DIR_PERFIL = os.path.abspath("./perfil_robo_softexpert")
+# Sessão autenticada reaproveitada entre execuções e pelos workers (contém cookies: não compartilhar)
+ARQUIVO_SESSAO = os.path.abspath("./sessao_softexpert.json")
+# Tempo máximo (ms) da sondagem que decide se precisa fazer o login completo
+TIMEOUT_SONDA_SESSAO = 15000
 
 # --- SELETORES LOGIN ---
 SEL_CAMPO_USUARIO = 'input[id="user"]'
@@ -18,4 +22,14 @@ SEL_BOTAO_ALERT_CONFIRM = 'button[id="alertConfirm"]'
 # --- SELETOR CORRIGIDO DA BARRA DE PESQUISA ---
 # Agora pegamos apenas o input 85 que está dentro do container de filtro
 # O atributo debounce="100" diferencia ele da barra do menu (que é 250)
-SEL_BARRA_PESQUISA = 'input[data-test-id="85"][debounce="100"]'
\ No newline at end of file
+SEL_BARRA_PESQUISA = 'input[data-test-id="85"][debounce="100"]'
+
+# --- ESPERAS (esperas.py) ---
+# Trecho da URL da requisição que recarrega a grid (None = espera a grid mudar no DOM)
+PADRAO_XHR_GRID = None
+# Teto (ms) de cada espera pela resposta da grid/popup
+TIMEOUT_XHR_GRID = 15000
+
+# --- AUDITORIA EM LOTE (tarefa_03) ---
+# Botão de próxima página da grid (sem ele, a grid é rolada com PageDown)
+SEL_PROXIMA_PAGINA = 'button[title="Próxima página"], a[title="Próxima página"]'
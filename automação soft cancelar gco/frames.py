@@ -0,0 +1,162 @@
+import threading
+import weakref
+import esperas
+
+# --- RESOLUÇÃO DE ELEMENTOS EM FRAMES (COM CACHE) ---
+# O SoftExpert desenha a grid, a barra de pesquisa e os filtros dentro de iframes.
+# Em vez de varrer a página principal + todos os frames a cada busca, o resolvedor
+# lembra em qual frame cada seletor (ou grupo de buscas, ex: "grid") foi achado e vai
+# direto nele. Só varre de novo quando erra ou quando aquele frame navega.
+
+class ResolvedorFrames:
+    def __init__(self, page):
+        self.page = page
+        self._cache = {}  # chave -> frame onde o elemento foi achado da última vez
+        self.acertos = 0
+        self.falhas = 0
+        page.on("framenavigated", self._ao_navegar)
+        page.on("framedetached", self._ao_navegar)
+
+    def _ao_navegar(self, frame):
+        # Navegação da página principal troca todos os iframes: esvazia o cache
+        if frame == self.page.main_frame:
+            self._cache.clear()
+            return
+        for chave in [c for c, f in self._cache.items() if f == frame]:
+            del self._cache[chave]
+
+    def _frames(self):
+        principal = self.page.main_frame
+        return [principal] + [f for f in self.page.frames if f != principal]
+
+    @staticmethod
+    def _visivel(fabrica, frame):
+        try:
+            loc = fabrica(frame)
+            if loc.count() > 0 and loc.first.is_visible():
+                return loc.first
+        except Exception:
+            pass
+        return None
+
+    def _frame_valido(self, chave):
+        frame = self._cache.get(chave)
+        if frame is not None and frame.is_detached():
+            return None
+        return frame
+
+    def localizar(self, chave, fabrica, varrer=True, reserva=None):
+        """
+        'fabrica(frame)' monta o locator dentro do frame. Devolve o primeiro visível ou None.
+        varrer=False (espera em loop): se o frame lembrado errar, devolve None sem varrer os
+        outros; sem frame lembrado para a chave, usa o da chave 'reserva' (ex: a grid).
+        Só varre tudo quando não há nenhum frame conhecido.
+        """
+        frame = self._frame_valido(chave)
+        if frame is None and not varrer and reserva is not None:
+            frame = self._frame_valido(reserva)
+        if frame is not None:
+            loc = self._visivel(fabrica, frame)
+            if loc is not None:
+                self.acertos += 1
+                self._cache[chave] = frame
+                return loc
+            if not varrer:
+                return None
+        self._cache.pop(chave, None)
+
+        self.falhas += 1
+        for frame in self._frames():
+            loc = self._visivel(fabrica, frame)
+            if loc is not None:
+                self._cache[chave] = frame
+                return loc
+        return None
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        taxa = (self.acertos / total * 100) if total else 0.0
+        return f"{self.acertos} acertos / {self.falhas} varreduras ({taxa:.0f}% direto no frame certo)"
+
+
+# Um resolvedor por aba (cada worker do modo paralelo tem a sua)
+_resolvedores = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def resolvedor(page) -> ResolvedorFrames:
+    with _lock:
+        if page not in _resolvedores:
+            _resolvedores[page] = ResolvedorFrames(page)
+        return _resolvedores[page]
+
+
+# --- BUSCAS COMPARTILHADAS PELAS TAREFAS ---
+def buscar_elemento_em_frames(page, seletor):
+    """Procura o seletor na página principal e nos iframes (frame lembrado pelo cache)."""
+    return resolvedor(page).localizar(seletor, lambda f: f.locator(seletor))
+
+def localizar_texto(page, texto, exact=False, chave="grid"):
+    """
+    Texto de um item da grid. A chave agrupa as buscas pelo frame que as hospeda:
+    todos os clientes/GCOs ficam no mesmo frame da grid.
+    """
+    return resolvedor(page).localizar(chave, lambda f: f.get_by_text(texto, exact=exact))
+
+def verificar_grid_vazia(page, varrer=True):
+    return resolvedor(page).localizar(
+        "grid_vazia", lambda f: f.get_by_text(esperas.MSG_GRID_VAZIA), varrer=varrer, reserva="grid"
+    ) is not None
+
+def localizar_item_com_insistencia(page, termo, tentativas=5):
+    """Procura o item; se não estiver visível, rola a lista (PageDown) e espera novas linhas."""
+    for tentativa in range(tentativas):
+        loc = localizar_texto(page, termo)
+        if loc is not None:
+            return loc
+
+        print(f"   -> [SCROLL] Item não visível. Rolando lista... ({tentativa+1}/{tentativas})")
+        try:
+            linhas_antes = esperas.contar_linhas(page)
+            page.mouse.click(500, 500)
+            page.keyboard.press("PageDown")
+            # Segue assim que a grid renderizar mais linhas (teto de 1s, como a pausa antiga)
+            esperas.aguardar_mudanca_linhas(page, linhas_antes, timeout_s=1)
+        except:
+            pass
+
+    return None
+
+def localizar_item_na_grid(page, nome_cliente, timeout_s=10):
+    """
+    Devolve o item, "VAZIO" se a grid disser que não há resultados, ou None após 'timeout_s'.
+    Uma varredura completa dos frames no início; depois o loop só reconsulta o frame da grid.
+    """
+    def procurar(varrer):
+        if verificar_grid_vazia(page, varrer):
+            return "VAZIO"
+        return resolvedor(page).localizar(
+            "grid", lambda f: f.get_by_text(nome_cliente), varrer=varrer, reserva="grid_vazia"
+        )
+
+    resultado = procurar(True) or esperas.aguardar_condicao(lambda: procurar(False), timeout_s)
+    if resultado == "VAZIO":
+        print("   -> [INFO] Mensagem 'Não encontramos nenhum resultado' detectada.")
+    return resultado
+
+def aguardar_item_lista(page, texto, timeout_s):
+    """Item '.listsItem' (filtros laterais) com o texto, esperando até 'timeout_s' (None = não apareceu)."""
+    return esperas.aguardar_condicao(
+        lambda: resolvedor(page).localizar(
+            ("listsItem", texto), lambda f: f.locator(".listsItem").filter(has_text=texto)
+        ),
+        timeout_s,
+        intervalo_s=0.5,
+    )
+
+def clicar_item_lista(page, texto, timeout_s):
+    """Clica no item '.listsItem' com o texto, esperando até 'timeout_s'."""
+    alvo = aguardar_item_lista(page, texto, timeout_s)
+    if alvo is None:
+        return False
+    alvo.click()
+    return True
@@ -33,6 +33,7 @@ def exibir_menu():
 def main():
     # Se estiver no Docker, podemos passar o ID da tarefa como argumento
     # Ex: docker compose run robo python main.py 3
+    # Ex (4 navegadores em paralelo): docker compose run robo python main.py 3 4
     opcao_automatica = sys.argv[1] if len(sys.argv) > 1 else None
 
     # 1. Escolha da Tarefa
@@ -46,6 +47,9 @@ def main():
         print("Saindo...")
         return
 
+    # Modo paralelo: login uma vez e N navegadores dividindo as linhas da planilha
+    n_workers = utils.perguntar_workers()
+
     # 2. Inicialização do Navegador (Centralizada)
     with sync_playwright() as p:
         # Usa o utils para configurar (Headless ou Não) automaticamente
@@ -68,7 +72,7 @@ def main():
         if escolha == '1':
             # Renomeie seu arquivo antigo de cancelar gco para tarefa_01.py
             if hasattr(tarefa_01, 'executar'):
-                tarefa_01.executar(page)
+                tarefa_01.executar(page, n_workers)
             else:
                 print("Erro: tarefa_01 não tem função executar()")
 
@@ -78,10 +82,10 @@ def main():
             page.goto("https://pemi.softexpert.com/softexpert/workspace?page=execution,104,1")
             
             # Chama a função executar do arquivo tarefa_02.py
-            tarefa_02.executar(page)
+            tarefa_02.executar(page, n_workers)
         elif escolha == '3':
             # A tarefa 03 usa a mesma url da 01 (Home), então não precisa navegar
-            tarefa_03.executar(page)
+            tarefa_03.executar(page, n_workers)
 
         print("\n✅ Fluxo Encerrado.")
         
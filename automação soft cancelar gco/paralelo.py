@@ -0,0 +1,128 @@
+import threading
+from playwright.sync_api import sync_playwright
+import utils
+import frames
+from auth import Autenticador
+
+# --- EXECUÇÃO DAS LINHAS (SERIAL OU EM PARALELO) ---
+# Cada tarefa expõe:
+#   URL_INICIAL (opcional)                        -> página onde os workers começam (padrão: a home, URL_LOGIN)
+#   preparar_pagina(page)                         -> ajustes da aba antes do loop (timeouts, filtros...)
+#   processar_linha(page, index, row, opcoes, estado) -> texto com o resultado da linha
+# 'estado' é um dicionário próprio de cada navegador (ex: contador para refresh).
+# 'ao_concluir(index, resultado)' (opcional) é chamado a cada linha terminada, inclusive
+# falhas, para a tarefa gravar o relatório sem esperar o fim da execução.
+
+# Serializa as chamadas de 'ao_concluir' entre os workers (ex: escrita no mesmo arquivo)
+_lock_conclusao = threading.Lock()
+
+
+def _concluir(ao_concluir, index, resultado):
+    if ao_concluir is None:
+        return
+    with _lock_conclusao:
+        ao_concluir(index, resultado)
+
+
+def processar_linhas(page, linhas, tarefa, opcoes, resultados=None, ao_concluir=None):
+    """
+    Processa as linhas (lista de (index, row)) numa única aba. Devolve [(index, resultado)].
+    'resultados' recebe cada linha assim que termina (o worker vê o que já foi feito se abortar).
+    """
+    tarefa.preparar_pagina(page)
+    estado = {"processados": 0}
+    resultados = [] if resultados is None else resultados
+
+    for index, row in linhas:
+        try:
+            resultado = tarefa.processar_linha(page, index, row, opcoes, estado)
+        except Exception as e:
+            print(f"   -> [FALHA] [Linha {index+1}] {e}")
+            resultado = f"FALHA: {e}"
+            # Tenta devolver o foco para a aba principal antes da próxima linha
+            try: page.bring_to_front()
+            except: pass
+        if resultado is not None:
+            estado["processados"] += 1
+        resultados.append((index, resultado))
+        _concluir(ao_concluir, index, resultado)
+
+    print(f"--> [FRAMES] {frames.resolvedor(page).estatisticas()}")
+    return resultados
+
+
+def dividir_linhas(linhas, n_workers):
+    """Fatias contíguas e equilibradas (o worker 1 pega o começo da planilha, e assim por diante)."""
+    tamanho, sobra = divmod(len(linhas), n_workers)
+    fatias, inicio = [], 0
+    for i in range(n_workers):
+        fim = inicio + tamanho + (1 if i < sobra else 0)
+        fatias.append(linhas[inicio:fim])
+        inicio = fim
+    return [f for f in fatias if f]
+
+
+def _worker(nome, estado_autenticado, linhas, tarefa, opcoes, saida, ao_concluir):
+    print(f"--> [{nome}] Iniciando com {len(linhas)} linhas (Linha {linhas[0][0]+1} até {linhas[-1][0]+1}).")
+    saida[nome] = []
+    try:
+        # sync_playwright não é thread-safe: cada worker tem o seu
+        with sync_playwright() as p:
+            context = utils.configurar_contexto_worker(p, estado_autenticado)
+            try:
+                page = context.new_page()
+                # Sondagem rápida: a sessão clonada precisa ser aceita (sem login/MFA por worker)
+                if not Autenticador(page).sessao_valida():
+                    raise Exception("Sessão clonada não foi aceita pelo sistema.")
+                url_inicial = getattr(tarefa, "URL_INICIAL", None)
+                if url_inicial:
+                    page.goto(url_inicial)
+                processar_linhas(page, linhas, tarefa, opcoes, saida[nome], ao_concluir)
+            finally:
+                context.browser.close()
+    except Exception as e:
+        print(f"--> [{nome}] Worker abortado: {e}")
+        # Linhas que o worker não chegou a concluir entram no resultado como falha
+        feitas = {index for index, _ in saida[nome]}
+        for index, _ in linhas:
+            if index not in feitas:
+                saida[nome].append((index, f"FALHA: worker abortado ({e})"))
+                _concluir(ao_concluir, index, f"FALHA: worker abortado ({e})")
+    print(f"--> [{nome}] Encerrado.")
+
+
+def executar(page, df, tarefa, opcoes=None, n_workers=1, ao_concluir=None):
+    """
+    Roda a tarefa sobre o DataFrame (já fatiado). Com 1 worker usa a própria aba logada;
+    com N, clona a sessão autenticada (storage_state) em N navegadores e divide as linhas.
+    Devolve [(index, resultado)] na ordem das linhas da planilha.
+    """
+    linhas = list(df.iterrows())
+    opcoes = opcoes or {}
+
+    if n_workers <= 1 or len(linhas) <= 1:
+        return processar_linhas(page, linhas, tarefa, opcoes, ao_concluir=ao_concluir)
+
+    # Login feito uma única vez: cookies + localStorage da aba principal
+    estado_autenticado = page.context.storage_state()
+    fatias = dividir_linhas(linhas, n_workers)
+    print(f"--> [PARALELO] {len(linhas)} linhas divididas entre {len(fatias)} navegadores.")
+
+    saida = {}
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(f"WORKER {i+1}", estado_autenticado, fatia, tarefa, opcoes, saida, ao_concluir),
+            daemon=True,
+        )
+        for i, fatia in enumerate(fatias)
+    ]
+    for t in threads:
+        t.start()
+    # join com timeout: um join sem limite não deixa o Ctrl+C chegar na thread principal
+    # (os workers são daemon e morrem com o processo)
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=0.5)
+
+    return sorted((r for resultados in saida.values() for r in resultados), key=lambda r: r[0])
@@ -1,9 +1,12 @@
 import pandas as pd
 import warnings
 import config
-import time
 import os
+import sys
 import utils  # <--- Importante: Importando o utils
+import paralelo
+import frames  # Busca em iframes com cache do frame de cada elemento
+import esperas  # Esperas por sinais (XHR da grid, popup pronto) no lugar de sleeps
 
 # Ignora avisos do Excel
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
@@ -23,36 +26,20 @@ def formatar_valor(valor):
         return f"{valor[:3]}-{valor[3:]}"
     return valor
 
-def buscar_elemento_em_frames(page, seletor):
-    try:
-        if page.locator(seletor).first.is_visible():
-            return page.locator(seletor).first
-    except: pass
-    for frame in page.frames:
-        try:
-            if frame.locator(seletor).first.is_visible():
-                return frame.locator(seletor).first
-        except: continue
-    return None
-
 def realizar_pesquisa(page, termo):
     print(f"   -> [BUSCA] Procurando barra...")
-    barra = buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
+    barra = frames.buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
     
     if not barra:
-        barra = buscar_elemento_em_frames(page, 'input[placeholder="Pesquisar"]')
+        barra = frames.buscar_elemento_em_frames(page, 'input[placeholder="Pesquisar"]')
         
     if not barra:
         raise Exception("Barra de pesquisa não encontrada!")
 
     try:
-        barra.click()
-        barra.press("Control+A")
-        barra.press("Backspace")
-        time.sleep(0.5)
-        barra.fill(termo)
-        time.sleep(0.5) 
-        barra.press("Enter")
+        # Segue assim que a grid responder ao Enter (sem pausas fixas)
+        if not esperas.pesquisar(page, barra, termo):
+            print("   -> [AVISO] Grid não respondeu à pesquisa dentro do limite.")
         print(f"   -> [BUSCA] '{termo}' enviado.")
     except Exception as e:
         raise Exception(f"Erro na barra: {e}")
@@ -69,31 +56,107 @@ def verificar_icone_cancelado(item_locator):
     except:
         return False
 
-def localizar_item_com_insistencia(page, termo):
-    for tentativa in range(5): 
-        # 1. Procura na Principal
-        loc = page.get_by_text(termo, exact=False)
-        if loc.count() > 0 and loc.first.is_visible():
-            return loc.first
+# --- PROCESSAMENTO DE UMA LINHA (usado no modo serial e por cada worker) ---
+def preparar_pagina(page):
+    # Configura paciência para rede lenta
+    page.set_default_timeout(TIMEOUT_PACIENCIA)
+    page.wait_for_load_state("networkidle")
+    # Página pronta = barra de pesquisa disponível
+    esperas.aguardar_condicao(lambda: frames.buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA), timeout_s=10)
+
+def processar_linha(page, index, row, opcoes, estado):
+    valor_original = row[COLUNA_EXCEL]
+    valor_formatado = formatar_valor(valor_original)
+    
+    # index+1 é a linha real do Excel
+    print(f"\n[Linha {index+1}] Item: {valor_formatado}")
+    
+    nova_pagina = None
+    try:
+        # PESQUISA
+        realizar_pesquisa(page, valor_formatado)
+
+        # LOCALIZAR
+        item_locator = frames.localizar_item_com_insistencia(page, valor_formatado)
+        
+        # RETRY DE PESQUISA
+        if not item_locator:
+            print("   -> [RETRY] Tentando pesquisar novamente...")
+            barra = frames.buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
+            if barra:
+                barra.click()
+                barra.fill("")
+                barra.type(valor_formatado, delay=100)
+                esperas.executar_e_aguardar_grid(page, lambda: barra.press("Enter"))
+                item_locator = frames.localizar_item_com_insistencia(page, valor_formatado)
+
+        if not item_locator:
+            print("   -> [ERRO] Item não encontrado.")
+            return "NAO ENCONTRADO"
+
+        # CHECK DE CANCELAMENTO
+        if verificar_icone_cancelado(item_locator):
+            print(f"   -> [PULADO] Já cancelado (ícone detectado).")
+            return "JA CANCELADO"
+
+        # CLICAR BOTÃO DIREITO
+        item_locator.scroll_into_view_if_needed()
+        item_locator.click(button="right")
+
+        # MENU + POPUP (a espera pela janela começa antes do clique que a abre)
+        with page.context.expect_page(timeout=TIMEOUT_PACIENCIA) as evento_janela:
+            try:
+                page.get_by_text("Alterar situação").first.click(timeout=4000)
+            except:
+                clicou = False
+                for frame in page.frames:
+                    try:
+                        frame.get_by_text("Alterar situação").first.click(timeout=500)
+                        clicou = True; break
+                    except: continue
+                if not clicou: raise Exception("Menu sumiu.")
+        
+        nova_pagina = evento_janela.value
+        # Formulário pronto = opção "Cancelar" visível
+        esperas.aguardar_popup_pronto(nova_pagina, "text=Cancelar")
+        
+        # CONFIRMAÇÃO EXTRA
+        opcao_cancelar = nova_pagina.get_by_label("Cancelar").first
+        if not opcao_cancelar.count():
+            opcao_cancelar = nova_pagina.get_by_text("Cancelar").first
+
+        if opcao_cancelar.is_disabled():
+            print(f"   -> [PULADO] Opção desabilitada no popup.")
+            nova_pagina.close()
+            page.bring_to_front()
+            return "OPCAO DESABILITADA"
         
-        # 2. Procura nos Frames
-        for frame in page.frames:
-            loc_frame = frame.get_by_text(termo, exact=False)
-            if loc_frame.count() > 0 and loc_frame.first.is_visible():
-                return loc_frame.first
+        # EXECUTAR
+        opcao_cancelar.click()
         
-        print(f"   -> [SCROLL] Item não visível. Rolando lista... ({tentativa+1}/5)")
-        try:
-            page.mouse.click(500, 500) 
-            page.keyboard.press("PageDown")
-            page.wait_for_timeout(1000)
-        except:
-            pass
-            
-    return None
+        # --- PREENCHIMENTO COM A VARIÁVEL ---
+        nova_pagina.locator("textarea").fill(opcoes["justificativa"]) 
+        # ------------------------------------
+        
+        nova_pagina.keyboard.press("Tab")
+        nova_pagina.keyboard.press("Enter")
+        
+        print(f"   -> [SUCESSO] Cancelado.")
+        
+        # RETORNAR
+        page.bring_to_front()
+        return "CANCELADO"
+        
+    except Exception as e:
+        print(f"   -> [FALHA] {e}")
+        try: nova_pagina.close()
+        except: pass
+        try: page.bring_to_front() 
+        except: pass
+        return f"FALHA: {e}"
 
 # --- FUNÇÃO PRINCIPAL CHAMADA PELA MAIN ---
-def executar(page):
+def executar(page, n_workers=1):
     print(f"--> [TAREFA 01] Lendo Excel: {ARQUIVO_EXCEL}")
     try:
         df = pd.read_excel(ARQUIVO_EXCEL)
@@ -120,106 +183,13 @@ def executar(page):
     print("="*40 + "\n")
     # --------------------------------------------
 
-    # Configura paciência para rede lenta
-    page.set_default_timeout(TIMEOUT_PACIENCIA)
-
     print("\n--- INICIANDO PROCESSAMENTO ---")
-    page.wait_for_load_state("networkidle")
-    time.sleep(3) 
     
-    # Itera sobre o DataFrame fatiado
-    for index, row in df_processamento.iterrows():
-        
-        valor_original = row[COLUNA_EXCEL]
-        valor_formatado = formatar_valor(valor_original)
-        
-        # index+1 é a linha real do Excel
-        print(f"\n[Linha {index+1}] Item: {valor_formatado}")
-        
-        try:
-            # PESQUISA
-            realizar_pesquisa(page, valor_formatado)
-            page.wait_for_timeout(2000) 
-
-            # LOCALIZAR
-            item_locator = localizar_item_com_insistencia(page, valor_formatado)
-            
-            # RETRY DE PESQUISA
-            if not item_locator:
-                print("   -> [RETRY] Tentando pesquisar novamente...")
-                barra = buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
-                if barra:
-                    barra.click()
-                    barra.fill("")
-                    time.sleep(0.5)
-                    barra.type(valor_formatado, delay=100)
-                    barra.press("Enter")
-                    page.wait_for_timeout(3000)
-                    item_locator = localizar_item_com_insistencia(page, valor_formatado)
-
-            if not item_locator:
-                print("   -> [ERRO] Item não encontrado.")
-                continue
-
-            # CHECK DE CANCELAMENTO
-            if verificar_icone_cancelado(item_locator):
-                print(f"   -> [PULADO] Já cancelado (ícone detectado).")
-                continue 
-
-            # CLICAR BOTÃO DIREITO
-            item_locator.scroll_into_view_if_needed()
-            item_locator.click(button="right")
-
-            # MENU
-            try:
-                page.get_by_text("Alterar situação").first.click(timeout=4000)
-            except:
-                clicou = False
-                for frame in page.frames:
-                    try:
-                        frame.get_by_text("Alterar situação").first.click(timeout=500)
-                        clicou = True; break
-                    except: continue
-                if not clicou: raise Exception("Menu sumiu.")
-            
-            # POPUP
-            with page.context.expect_page(timeout=TIMEOUT_PACIENCIA) as evento_janela:
-                pass 
-            
-            nova_pagina = evento_janela.value
-            nova_pagina.wait_for_load_state()
-            
-            # CONFIRMAÇÃO EXTRA
-            opcao_cancelar = nova_pagina.get_by_label("Cancelar").first
-            if not opcao_cancelar.count():
-                opcao_cancelar = nova_pagina.get_by_text("Cancelar").first
-
-            if opcao_cancelar.is_disabled():
-                print(f"   -> [PULADO] Opção desabilitada no popup.")
-                nova_pagina.close()
-                page.bring_to_front()
-                continue 
-            
-            # EXECUTAR
-            opcao_cancelar.click()
-            
-            # --- PREENCHIMENTO COM A VARIÁVEL ---
-            nova_pagina.locator("textarea").fill(justificativa_final) 
-            # ------------------------------------
-            
-            nova_pagina.keyboard.press("Tab")
-            nova_pagina.keyboard.press("Enter")
-            
-            print(f"   -> [SUCESSO] Cancelado.")
-            
-            # RETORNAR
-            page.bring_to_front()
-            
-        except Exception as e:
-            print(f"   -> [FALHA] {e}")
-            try: nova_pagina.close()
-            except: pass
-            try: page.bring_to_front() 
-            except: pass
+    # Serial na própria aba (1 worker) ou dividido entre N navegadores logados
+    resultados = paralelo.executar(
+        page, df_processamento, sys.modules[__name__], {"justificativa": justificativa_final}, n_workers
+    )
 
+    cancelados = sum(1 for _, r in resultados if r == "CANCELADO")
+    print(f"--> [RESUMO] {cancelados} cancelados de {len(resultados)} linhas.")
     print("--> Tarefa 01 concluída.")
\ No newline at end of file
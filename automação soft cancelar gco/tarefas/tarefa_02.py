@@ -1,9 +1,12 @@
 import pandas as pd
 import warnings
 import config
-import time
 import os
+import sys
 import utils  # <--- Import do Fatiador
+import paralelo
+import frames  # Busca em iframes com cache do frame de cada elemento
+import esperas  # Esperas por sinais (XHR da grid, popup pronto) no lugar de sleeps
 
 # Ignora avisos do Excel
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
@@ -13,6 +16,7 @@ ARQUIVO_EXCEL = 'GCO-004 - 6ª Importação - 08-12-2024_1715.xlsx'
 COLUNA_CLIENTE = 'Nome do Cliente'
 SRC_ICONE_CANCELADO = "cancelado.png"
 SELETOR_BARRA_RAPIDA = '#bc_quick_filter'
+URL_INICIAL = "https://pemi.softexpert.com/softexpert/workspace?page=execution,104,1"
 
 # Configuração de Performance
 ITENS_PARA_REFRESH = 25  
@@ -31,203 +35,160 @@ def formatar_valor(valor):
     if pd.isna(valor): return ""
     return str(valor).strip()
 
-def buscar_elemento_em_frames(page, seletor, timeout=5000):
-    try:
-        loc = page.locator(seletor).first
-        if loc.is_visible(timeout=timeout): return loc
-    except: pass
-    for frame in page.frames:
-        try:
-            loc = frame.locator(seletor).first
-            if loc.is_visible(timeout=timeout): return loc
-        except: continue
-    return None
-
 def clicar_filtro_escrituracao(page):
     print("--> [AÇÃO] Procurando filtro 'Escrituração de Lotes'...")
-    texto_filtro = "Escrituração de Lotes"
-    inicio = time.time()
-    
-    while time.time() - inicio < (TIMEOUT_PACIENCIA / 1000):
-        try:
-            alvo = page.locator(".listsItem").filter(has_text=texto_filtro).first
-            if alvo.is_visible():
-                alvo.click()
-                return True
-        except: pass
-
-        for frame in page.frames:
-            try:
-                alvo = frame.locator(".listsItem").filter(has_text=texto_filtro).first
-                if alvo.is_visible():
-                    alvo.click()
-                    return True
-            except: continue
-        time.sleep(1)
-    return False
+    # Primeiro espera o filtro aparecer; só o clique conta para a espera da grid
+    filtro = frames.aguardar_item_lista(page, "Escrituração de Lotes", TIMEOUT_PACIENCIA / 1000)
+    if filtro is None:
+        return False
+    # O filtro recarrega a grid: espera ela mudar em vez de 5s fixos
+    if not esperas.executar_e_aguardar_grid(page, filtro.click):
+        print("   -> [AVISO] Grid não recarregou após o filtro dentro do limite.")
+    return True
 
 def realizar_pesquisa_rapida(page, termo):
     print(f"   -> [BUSCA] Procurando barra '{SELETOR_BARRA_RAPIDA}'...")
-    barra = None
-    inicio = time.time()
-    while not barra and (time.time() - inicio < (TIMEOUT_PACIENCIA / 1000)):
-        barra = buscar_elemento_em_frames(page, SELETOR_BARRA_RAPIDA, timeout=1000)
-        if not barra: time.sleep(1)
+    barra = esperas.aguardar_condicao(
+        lambda: frames.buscar_elemento_em_frames(page, SELETOR_BARRA_RAPIDA), TIMEOUT_PACIENCIA / 1000, intervalo_s=0.5
+    )
     
     if not barra: raise Exception("Barra de pesquisa não carregou.")
 
     try:
-        barra.click()
-        barra.press("Control+A")
-        barra.press("Backspace")
-        time.sleep(0.5) 
-        barra.fill(termo)
-        time.sleep(0.5)
-        barra.press("Enter")
+        # Segue assim que a grid responder ao Enter (sem pausas fixas)
+        if not esperas.pesquisar(page, barra, termo):
+            print("   -> [AVISO] Grid não respondeu à pesquisa dentro do limite.")
         print(f"   -> [BUSCA] '{termo}' enviado.")
     except Exception as e:
         raise Exception(f"Erro na barra: {e}")
 
-def verificar_grid_vazia(page):
-    mensagem = "Não encontramos nenhum resultado"
-    if page.get_by_text(mensagem).is_visible(): return True
-    for frame in page.frames:
-        if frame.get_by_text(mensagem).is_visible(): return True
-    return False
-
-def localizar_item_na_grid(page, nome_cliente):
-    for _ in range(10):
-        if verificar_grid_vazia(page):
-            print("   -> [INFO] Mensagem 'Não encontramos nenhum resultado' detectada.")
-            return "VAZIO"
-
-        loc = page.get_by_text(nome_cliente, exact=False)
-        if loc.count() > 0 and loc.first.is_visible():
-            return loc.first
-        
-        for frame in page.frames:
-            loc_frame = frame.get_by_text(nome_cliente, exact=False)
-            if loc_frame.count() > 0 and loc_frame.first.is_visible():
-                return loc_frame.first
-        
-        time.sleep(1)
-    return None
-
-def executar(page):
-    print(f"--> [TAREFA 02] Lendo Excel: {ARQUIVO_EXCEL}")
-    try:
-        df = pd.read_excel(ARQUIVO_EXCEL)
-        df.columns = df.columns.str.strip()
-    except Exception as e:
-        print(f"ERRO EXCEL: {e}")
-        return
-
-    # --- 1. FATIADOR (Pergunta quantidade) ---
-    df_processamento = utils.fatiar_dataframe(df)
-    # -----------------------------------------
+def resetar_ambiente(page):
+    print("--> [REFRESH] Carregando página...")
+    page.goto(URL_INICIAL)
+    try: page.wait_for_load_state("networkidle", timeout=60000)
+    except: pass
+    clicar_filtro_escrituracao(page)
 
-    # --- 2. VIGILANTE DE ALERTS ---
+# --- PROCESSAMENTO DE UMA LINHA (usado no modo serial e por cada worker) ---
+def preparar_pagina(page):
+    # --- VIGILANTE DE ALERTS ---
     # Se aparecer qualquer window.alert, clica em OK automaticamente
     page.on("dialog", lidar_com_alerta)
     # ------------------------------
 
     page.set_default_timeout(TIMEOUT_PACIENCIA)
-    
-    def resetar_ambiente():
-        print("--> [REFRESH] Carregando página...")
-        page.goto("https://pemi.softexpert.com/softexpert/workspace?page=execution,104,1")
-        try: page.wait_for_load_state("networkidle", timeout=60000)
+    resetar_ambiente(page)
+
+def processar_linha(page, index, row, opcoes, estado):
+    # Índice real do Excel
+    idx_excel = index + 1
+
+    # Contagem por navegador: cada worker faz a sua limpeza periódica
+    itens_processados = estado["processados"]
+    if itens_processados > 0 and itens_processados % ITENS_PARA_REFRESH == 0:
+        print(f"\n--- [REFRESH] Limpeza de memória (Item {itens_processados}) ---")
+        try: resetar_ambiente(page)
         except: pass
-        clicar_filtro_escrituracao(page)
-        time.sleep(5) 
+    
+    try:
+        nome_cliente = str(row[COLUNA_CLIENTE]).strip()
+    except: return None
+    
+    if not nome_cliente or nome_cliente.lower() == 'nan': return None
 
-    resetar_ambiente()
-    print("\n--- INICIANDO LOOP ---")
+    print(f"\n[Linha {idx_excel}] Cliente: {nome_cliente}")
     
-    itens_processados = 0
+    nova_pagina = None
+    try:
+        # 1. PESQUISA
+        realizar_pesquisa_rapida(page, nome_cliente)
 
-    for index, row in df_processamento.iterrows():
-        # Índice real do Excel
-        idx_excel = index + 1
+        # 2. LOCALIZAR
+        resultado_localizacao = frames.localizar_item_na_grid(page, nome_cliente)
 
-        if itens_processados > 0 and itens_processados % ITENS_PARA_REFRESH == 0:
-            print(f"\n--- [REFRESH] Limpeza de memória (Item {itens_processados}) ---")
-            try: resetar_ambiente()
-            except: pass
-        
-        try:
-            nome_cliente = str(row[COLUNA_CLIENTE]).strip()
-        except: continue
+        if resultado_localizacao == "VAZIO":
+            print("   -> [PULADO] Cliente não consta na base (Sem resultados).")
+            return "SEM RESULTADOS"
         
-        if not nome_cliente or nome_cliente.lower() == 'nan': continue
+        if not resultado_localizacao:
+            print("   -> [ERRO] Cliente não encontrado (Timeout de busca).")
+            return "NAO ENCONTRADO"
 
-        print(f"\n[Linha {idx_excel}] Cliente: {nome_cliente}")
-        itens_processados += 1
+        item_locator = resultado_localizacao
+
+        # 3. ABRIR TAREFA
+        print("   -> [AÇÃO] Abrindo atividade...")
+        item_locator.scroll_into_view_if_needed()
+        
+        # Aqui pode ocorrer o Alert. O 'page.on("dialog")' configurado acima vai lidar com ele.
+        with page.context.expect_page(timeout=TIMEOUT_PACIENCIA) as evento_janela:
+            item_locator.dblclick()
         
+        nova_pagina = evento_janela.value
+        nova_pagina.wait_for_load_state(timeout=TIMEOUT_PACIENCIA)
+        print("   -> [JANELA] Carregada.")
+
+        # 4. CLICAR NO BOTÃO
+        print("   -> [AÇÃO] Aguardando botão...")
+        btn = None
         try:
-            # 1. PESQUISA
-            realizar_pesquisa_rapida(page, nome_cliente)
-            time.sleep(2)
-
-            # 2. LOCALIZAR
-            resultado_localizacao = localizar_item_na_grid(page, nome_cliente)
-
-            if resultado_localizacao == "VAZIO":
-                print("   -> [PULADO] Cliente não consta na base (Sem resultados).")
-                continue 
-            
-            if not resultado_localizacao:
-                print("   -> [ERRO] Cliente não encontrado (Timeout de busca).")
-                continue
-
-            item_locator = resultado_localizacao
-
-            # 3. ABRIR TAREFA
-            print("   -> [AÇÃO] Abrindo atividade...")
-            item_locator.scroll_into_view_if_needed()
-            
-            # Aqui pode ocorrer o Alert. O 'page.on("dialog")' configurado acima vai lidar com ele.
-            with page.context.expect_page(timeout=TIMEOUT_PACIENCIA) as evento_janela:
-                item_locator.dblclick()
-            
-            nova_pagina = evento_janela.value
-            nova_pagina.wait_for_load_state(timeout=TIMEOUT_PACIENCIA)
-            print("   -> [JANELA] Carregada.")
-
-            # 4. CLICAR NO BOTÃO
-            print("   -> [AÇÃO] Aguardando botão...")
-            btn = None
+            nova_pagina.wait_for_selector('span[style*="13.png"]', state="visible", timeout=10000)
+            btn = nova_pagina.locator('span[style*="13.png"]').first
+        except: pass
+        
+        if not btn:
             try:
-                nova_pagina.wait_for_selector('span[style*="13.png"]', state="visible", timeout=10000)
-                btn = nova_pagina.locator('span[style*="13.png"]').first
+                nova_pagina.wait_for_selector("span.x-btn-inner:has-text('Aguarda para')", state="visible", timeout=5000)
+                btn = nova_pagina.locator('span.x-btn-inner').filter(has_text="Aguarda para").first
             except: pass
-            
-            if not btn:
-                try:
-                    nova_pagina.wait_for_selector("span.x-btn-inner:has-text('Aguarda para')", state="visible", timeout=5000)
-                    btn = nova_pagina.locator('span.x-btn-inner').filter(has_text="Aguarda para").first
-                except: pass
-
-            if btn and btn.is_visible():
-                time.sleep(1) 
-                btn.click(force=True)
+
+        if btn and btn.is_visible():
+            # Espera o próprio popup concluir (botão some ou janela fecha) antes de fechá-la
+            btn.click(force=True)
+            if esperas.aguardar_conclusao_popup(nova_pagina, btn):
                 print("   -> [SUCESSO] Botão clicado!")
-                time.sleep(3) 
-                try: nova_pagina.close()
-                except: pass
+                resultado = "EXECUTADO"
             else:
-                print("   -> [ERRO] Botão não encontrado.")
-                if os.getenv("MODO_DOCKER") == "true":
-                    nova_pagina.screenshot(path=f"erro_janela_{idx_excel}.png")
-                nova_pagina.close()
-
-            page.bring_to_front()
-            
-        except Exception as e:
-            print(f"   -> [FALHA] {e}")
+                print("   -> [AVISO] Botão clicado, mas o popup não confirmou dentro do limite.")
+                resultado = "EXECUTADO (SEM CONFIRMACAO)"
             try: nova_pagina.close()
             except: pass
-            try: page.bring_to_front() 
-            except: pass
+        else:
+            print("   -> [ERRO] Botão não encontrado.")
+            if os.getenv("MODO_DOCKER") == "true":
+                nova_pagina.screenshot(path=f"erro_janela_{idx_excel}.png")
+            nova_pagina.close()
+            resultado = "BOTAO NAO ENCONTRADO"
+
+        page.bring_to_front()
+        return resultado
+        
+    except Exception as e:
+        print(f"   -> [FALHA] {e}")
+        try: nova_pagina.close()
+        except: pass
+        try: page.bring_to_front() 
+        except: pass
+        return f"FALHA: {e}"
+
+def executar(page, n_workers=1):
+    print(f"--> [TAREFA 02] Lendo Excel: {ARQUIVO_EXCEL}")
+    try:
+        df = pd.read_excel(ARQUIVO_EXCEL)
+        df.columns = df.columns.str.strip()
+    except Exception as e:
+        print(f"ERRO EXCEL: {e}")
+        return
+
+    # --- 1. FATIADOR (Pergunta quantidade) ---
+    df_processamento = utils.fatiar_dataframe(df)
+    # -----------------------------------------
+
+    print("\n--- INICIANDO LOOP ---")
+
+    # Serial na própria aba (1 worker) ou dividido entre N navegadores logados
+    resultados = paralelo.executar(page, df_processamento, sys.modules[__name__], None, n_workers)
 
+    executados = sum(1 for _, r in resultados if r == "EXECUTADO")
+    print(f"--> [RESUMO] {executados} atividades executadas de {len(resultados)} linhas.")
     print("--> Tarefa 02 concluída.")
\ No newline at end of file
@@ -1,10 +1,13 @@
 import pandas as pd
 import warnings
 import config
-import time
 import datetime
 import os
+import sys
 import utils # <--- 1. Importante: Importar o utils
+import paralelo
+import frames  # Busca em iframes com cache do frame de cada elemento
+import esperas  # Esperas por sinais (XHR da grid, popup pronto) no lugar de sleeps
 
 # Ignora avisos do Excel
 warnings.filterwarnings("ignore", category=UserWarning, module="openpyxl")
@@ -17,41 +20,20 @@ STATUS_ESPERADO = "Aguarda para retorno"
 
 # --- FUNÇÕES AUXILIARES ---
 
-def buscar_elemento_em_frames(page, seletor):
-    """Procura elemento na página principal e nos iframes"""
-    try:
-        if page.locator(seletor).first.is_visible():
-            return page.locator(seletor).first
-    except:
-        pass
-    for frame in page.frames:
-        try:
-            if frame.locator(seletor).first.is_visible():
-                return frame.locator(seletor).first
-        except:
-            continue
-    return None
-
 def realizar_pesquisa(page, termo):
     print(f"   -> [BUSCA] Pesquisando: {termo}")
-    barra = buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
+    barra = frames.buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
     
     if not barra:
-        barra = buscar_elemento_em_frames(page, 'input[placeholder="Pesquisar"]')
+        barra = frames.buscar_elemento_em_frames(page, 'input[placeholder="Pesquisar"]')
         
     if not barra:
         return False
 
     try:
-        barra.click()
-        # Limpa campo
-        barra.press("Control+A")
-        barra.press("Backspace")
-        time.sleep(0.5)
-        
-        # Digita e envia
-        barra.fill(termo)
-        barra.press("Enter")
+        # Limpa, digita e envia; segue assim que a grid responder ao Enter
+        if not esperas.pesquisar(page, barra, termo):
+            print("   -> [AVISO] Grid não respondeu à pesquisa dentro do limite.")
         return True
     except:
         return False
@@ -60,19 +42,10 @@ def verificar_status_na_linha(page, nome_cliente):
     """
     Encontra a linha do cliente e verifica se contém o texto esperado.
     """
-    item_encontrado = None
-    
-    # 1. Procura o cliente (Texto exato ou parcial)
-    loc = page.get_by_text(nome_cliente, exact=False)
-    if loc.count() > 0 and loc.first.is_visible():
-        item_encontrado = loc.first
-    else:
-        # Tenta nos frames
-        for frame in page.frames:
-            loc = frame.get_by_text(nome_cliente, exact=True)
-            if loc.count() > 0 and loc.first.is_visible():
-                item_encontrado = loc.first
-                break
+    # 1. Procura o cliente (parcial na página principal, exato nos frames), direto no frame da grid
+    item_encontrado = frames.resolvedor(page).localizar(
+        "grid", lambda f: f.get_by_text(nome_cliente, exact=(f != page.main_frame))
+    )
     
     if not item_encontrado:
         return "NAO ENCONTRADO"
@@ -101,8 +74,292 @@ def escrever_relatorio(mensagem):
     with open(ARQUIVO_RELATORIO, "a", encoding="utf-8") as f:
         f.write(mensagem + "\n")
 
+# --- PROCESSAMENTO DE UMA LINHA (usado no modo serial e por cada worker) ---
+def preparar_pagina(page):
+    print("--> [SISTEMA] Aguardando estabilização da página...")
+    page.wait_for_load_state("networkidle")
+    # Página pronta = barra de pesquisa disponível
+    esperas.aguardar_condicao(lambda: frames.buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA), timeout_s=10)
+
+def processar_linha(page, index, row, opcoes, estado):
+    try:
+        nome_cliente = str(row[COLUNA_CLIENTE]).strip()
+    except:
+        return None
+    
+    # Pula vazios
+    if not nome_cliente or nome_cliente.lower() == 'nan': 
+        return None
+
+    # index+1 dá o número real da linha do Excel (pois o índice original é preservado)
+    print(f"\nVerificando [Linha {index+1}]: {nome_cliente}")
+    
+    # 1. Realiza a pesquisa na grid
+    if realizar_pesquisa(page, nome_cliente):
+        # 2. Verifica o status visualmente (a grid filtrada pode levar um instante para desenhar)
+        esperas.aguardar_condicao(lambda: frames.localizar_texto(page, nome_cliente), timeout_s=2)
+        resultado = verificar_status_na_linha(page, nome_cliente)
+        
+        print(f"   -> Status: {resultado}")
+        
+    else:
+        print("   -> [ERRO] Falha ao tentar pesquisar na barra.")
+        resultado = "ERRO DE PESQUISA (Barra não encontrada)"
+
+    # Limpa o foco para a próxima iteração
+    page.bring_to_front()
+    return resultado
+
+# --- AUDITORIA EM LOTE (UMA PASSADA PELA GRID EM VEZ DE UMA PESQUISA POR CLIENTE) ---
+# Lê todas as linhas da grid do workspace (já filtrada) página por página e cruza com a
+# planilha em memória. Fonte das linhas: o JSON da requisição da grid, quando PADRAO_XHR_GRID
+# está configurado (sem o padrão não dá para separar a grid dos outros XHRs); senão, um único
+# evaluate por página que devolve o texto de todas as linhas do frame da grid.
+
+# Botão de próxima página da grid (sem ele, a grid é rolada com PageDown)
+SEL_PROXIMA_PAGINA = getattr(config, "SEL_PROXIMA_PAGINA", 'button[title="Próxima página"], a[title="Próxima página"]')
+MAX_PAGINAS = 1000  # Trava de segurança contra paginação que nunca termina
+
+# Texto de cada linha "folha" (linha que não contém outra linha dentro), só as visíveis
+JS_LINHAS_GRID = """
+(seletor) => Array.from(document.querySelectorAll(seletor))
+    .filter(linha => !linha.querySelector(seletor))
+    .map(linha => linha.innerText)
+    .filter(texto => texto && texto.trim())
+"""
+
+JS_BOTAO_DESATIVADO = """
+(botao) => {
+    if (botao.disabled) return true;
+    for (let n = botao, nivel = 0; n && nivel < 3; n = n.parentElement, nivel++) {
+        if (n.getAttribute('aria-disabled') === 'true') return true;
+        if (/disabled/i.test(n.getAttribute('class') || '')) return true;
+    }
+    return false;
+}
+"""
+
+def perguntar_modo():
+    """Modo da auditoria: variável MODO_AUDITORIA ('pesquisa'/'lote') ou pergunta no terminal."""
+    valor = os.getenv("MODO_AUDITORIA")
+    if valor is None:
+        try:
+            valor = input("Modo da auditoria? [1] Pesquisa por cliente  [2] Lote (lê a grid uma vez) (Enter = 1): ")
+        except EOFError:
+            valor = ""
+    modo = "lote" if valor.strip().lower() in ("2", "lote") else "pesquisa"
+    print(f"--> [CONFIG] Modo da auditoria: {modo}")
+    return modo
+
+def _linhas_do_json(dados):
+    """Lista de objetos mais longa do JSON (as linhas da grid), cada uma virando texto separado por TAB."""
+    candidatas = []
+    def varrer(valor):
+        if isinstance(valor, dict):
+            for v in valor.values():
+                varrer(v)
+        elif isinstance(valor, list):
+            if valor and all(isinstance(v, dict) for v in valor):
+                candidatas.append(valor)
+            for v in valor:
+                varrer(v)
+    varrer(dados)
+    if not candidatas:
+        return []
+    registros = max(candidatas, key=len)
+    return [
+        "\t".join(str(v) for v in registro.values() if isinstance(v, (str, int, float)) and str(v).strip())
+        for registro in registros
+    ]
+
+def _linhas_das_respostas(respostas):
+    linhas = []
+    while respostas:
+        resposta = respostas.pop(0)
+        try:
+            linhas.extend(_linhas_do_json(resposta.json()))
+        except Exception:
+            continue  # Resposta sem JSON (ou já descartada pelo navegador)
+    return linhas
+
+def _frame_da_grid(page):
+    """Frame com mais linhas de grid (a grid do workspace). Um evaluate por frame, só na primeira página."""
+    melhor, melhor_total = None, 0
+    for frame in page.frames:
+        try:
+            total = len(frame.evaluate(JS_LINHAS_GRID, esperas.SEL_LINHAS_GRID))
+        except Exception:
+            continue
+        if total > melhor_total:
+            melhor, melhor_total = frame, total
+    return melhor
+
+def _retrato_pagina(frame_grid):
+    """(quantidade de linhas, texto da primeira) da página exibida na grid."""
+    linhas = frame_grid.evaluate(JS_LINHAS_GRID, esperas.SEL_LINHAS_GRID)
+    return len(linhas), (linhas[0] if linhas else "")
+
+def _aguardar_nova_pagina(page, frame_grid, acao, usar_xhr):
+    """Executa a ação e espera a página da grid trocar. True = trocou; False = teto estourado."""
+    antes = _retrato_pagina(frame_grid) if frame_grid is not None else None
+    if usar_xhr:
+        chegou = esperas.executar_e_aguardar_xhr(page, acao, padrao=esperas.PADRAO_XHR_GRID)
+        if antes is None:
+            return chegou
+    else:
+        acao()
+    if antes is None:
+        return False  # Sem XHR da grid e sem frame para comparar: não há como confirmar a troca
+    return esperas.aguardar_condicao(
+        lambda: _retrato_pagina(frame_grid) != antes, esperas.TIMEOUT_XHR / 1000
+    ) is not None
+
+def _botao_desativado(botao):
+    """
+    Próxima página desativada. O is_enabled() do Playwright só vale para controles de
+    formulário: um <a> de paginação vem sempre "ativo". Olha também aria-disabled e
+    classe 'disabled' no botão e nos dois pais (onde os grids costumam marcar).
+    """
+    try:
+        return botao.evaluate(JS_BOTAO_DESATIVADO)
+    except Exception:
+        return True  # Botão sumiu do DOM: não há para onde avançar
+
+def _avancar_pagina(page, frame_grid, usar_xhr):
+    """
+    Vai para a próxima página da grid (botão) ou rola a lista. False = fim da grid.
+    Botão clicado sem a página trocar é falha (exceção), não fim: a leitura estaria incompleta.
+    """
+    botao = frames.buscar_elemento_em_frames(page, SEL_PROXIMA_PAGINA)
+    if botao is None and frame_grid is not None and frame_grid.locator(SEL_PROXIMA_PAGINA).count() > 0:
+        return False  # Botão existe mas some na última página
+    if botao is not None:
+        if _botao_desativado(botao):
+            return False  # Última página
+        if not _aguardar_nova_pagina(page, frame_grid, botao.click, usar_xhr):
+            if _botao_desativado(botao):
+                return False  # Desativado só depois do clique: era a última
+            raise Exception("a grid não trocou de página após 'Próxima página'")
+        return True
+
+    # Sem paginação: grid com rolagem (mesmo PageDown usado na busca com insistência).
+    # Aqui a lista parar de mudar é o único sinal de fim.
+    def rolar():
+        page.mouse.click(500, 500)
+        page.keyboard.press("PageDown")
+    return _aguardar_nova_pagina(page, frame_grid, rolar, usar_xhr)
+
+def colher_linhas_grid(page):
+    """
+    Percorre a grid uma vez e devolve (texto de todas as linhas sem repetição, leitura completa?).
+    """
+    usar_xhr = esperas.PADRAO_XHR_GRID is not None
+    respostas = []
+    def coletar(response):
+        # Só guarda: o corpo é lido depois, fora do callback do evento
+        if esperas._eh_xhr(esperas.PADRAO_XHR_GRID)(response):
+            respostas.append(response)
+
+    vistas, linhas = set(), []
+    frame_grid = None
+    completa = True
+    if usar_xhr:
+        page.on("response", coletar)
+    try:
+        # Pesquisa vazia: a grid volta ao filtro do workspace (com o XHR da grid, a primeira
+        # página chega por ele). Sem XHR e com a barra já vazia, a grid já está como precisa.
+        barra = frames.buscar_elemento_em_frames(page, config.SEL_BARRA_PESQUISA)
+        if usar_xhr or barra is None or barra.input_value().strip():
+            realizar_pesquisa(page, "")
+
+        for pagina in range(1, MAX_PAGINAS + 1):
+            if frame_grid is None or frame_grid.is_detached():
+                frame_grid = _frame_da_grid(page)
+
+            pagina_linhas = _linhas_das_respostas(respostas) if usar_xhr else []
+            fonte = "XHR"
+            if not pagina_linhas:
+                if frame_grid is None:
+                    break
+                pagina_linhas = frame_grid.evaluate(JS_LINHAS_GRID, esperas.SEL_LINHAS_GRID)
+                fonte = "DOM"
+
+            novas = [texto for texto in pagina_linhas if texto not in vistas]
+            vistas.update(novas)
+            linhas.extend(novas)
+            print(f"   -> [LOTE] Página {pagina} ({fonte}): {len(novas)} linhas novas, {len(linhas)} no total.")
+
+            if not novas:
+                break
+            try:
+                if not _avancar_pagina(page, frame_grid, usar_xhr):
+                    break
+            except Exception as e:
+                print(f"   -> [AVISO] Leitura da grid interrompida na página {pagina}: {e}")
+                completa = False
+                break
+        else:
+            print(f"   -> [AVISO] Limite de {MAX_PAGINAS} páginas atingido: a grid pode ter mais linhas.")
+            completa = False
+    finally:
+        if usar_xhr:
+            page.remove_listener("response", coletar)
+
+    return linhas, completa
+
+def _normalizar(serie):
+    return serie.astype(str).str.replace(r"\s+", " ", regex=True).str.strip().str.casefold()
+
+def cruzar_com_planilha(df, linhas_grid, completa=True):
+    """
+    Junta planilha e grid pelo nome do cliente (igual a uma célula da linha, como a busca
+    exata nos frames). Devolve [(index, resultado)] com os mesmos textos do modo por pesquisa.
+    Com a leitura incompleta, quem não apareceu fica NAO VERIFICADO (pode estar nas páginas não lidas).
+    """
+    # fillna antes do astype: no pandas 3 'astype(str)' mantém NaN e a célula vazia passaria no filtro
+    planilha = pd.DataFrame({"nome": df[COLUNA_CLIENTE].fillna("").astype(str).str.strip()}, index=df.index)
+    planilha = planilha[(planilha["nome"] != "") & (planilha["nome"].str.lower() != "nan")]
+    planilha = planilha.rename_axis("linha_planilha").reset_index()
+    planilha["chave"] = _normalizar(planilha["nome"])
+
+    grid = pd.DataFrame({"texto": pd.Series(linhas_grid, dtype=object)})
+    grid["chave"] = grid["texto"].str.split(r"[\t\n]+", regex=True)
+    grid = grid.explode("chave")
+    grid["chave"] = _normalizar(grid["chave"])
+    grid = grid.drop_duplicates()
+
+    cruzado = planilha.merge(grid, on="chave", how="left")
+    cruzado["confirmado"] = cruzado["texto"].str.casefold().str.contains(STATUS_ESPERADO.casefold(), regex=False, na=False)
+    resumo = cruzado.groupby("linha_planilha", sort=True).agg(
+        encontrados=("texto", "count"), confirmado=("confirmado", "any"), texto=("texto", "first")
+    )
+
+    resultados = []
+    for index, linha in resumo.iterrows():
+        if linha["encontrados"] == 0:
+            resultado = "NAO ENCONTRADO" if completa else "NAO VERIFICADO (leitura da grid incompleta)"
+        elif linha["confirmado"]:
+            resultado = f"CONFIRMADO ({STATUS_ESPERADO})"
+        else:
+            texto_limpo = linha["texto"].replace('\n', ' ').replace('\t', ' ')[:50]
+            resultado = f"DIVERGENTE (Encontrado: {texto_limpo}...)"
+        resultados.append((index, resultado))
+    return resultados
+
+def auditar_em_lote(page, df):
+    preparar_pagina(page)
+    print("--> [LOTE] Lendo a grid do workspace...")
+    linhas_grid, completa = colher_linhas_grid(page)
+    print(f"--> [LOTE] {len(linhas_grid)} linhas lidas da grid. Cruzando com a planilha...")
+
+    resultados = cruzar_com_planilha(df, linhas_grid, completa)
+    for rotulo in ("CONFIRMADO", "DIVERGENTE", "NAO ENCONTRADO", "NAO VERIFICADO"):
+        total = sum(1 for _, r in resultados if r.startswith(rotulo))
+        print(f"   -> {rotulo}: {total}")
+    return resultados
+
 # --- FUNÇÃO PRINCIPAL CHAMADA PELA MAIN ---
-def executar(page):
+def executar(page, n_workers=1):
     print("--> [TAREFA 03] Iniciando Auditoria de Status...")
     
     # Prepara o arquivo de relatório (Sobrescreve o anterior com "w")
@@ -124,42 +381,20 @@ def executar(page):
     df_processamento = utils.fatiar_dataframe(df)
     # -----------------------------------------
 
-    print("--> [SISTEMA] Aguardando estabilização da página...")
-    page.wait_for_load_state("networkidle")
-    time.sleep(3)
+    # 3. Salva no TXT a cada linha concluída (um Ctrl+C ou queda não perde o que já foi feito)
+    def registrar(index, resultado):
+        if resultado is None:
+            return
+        nome_cliente = str(df_processamento.loc[index, COLUNA_CLIENTE]).strip()
+        escrever_relatorio(f"[Linha {index+1}] {nome_cliente}: {resultado}")
 
-    # Loop de processamento (Itera sobre o DF fatiado)
-    for index, row in df_processamento.iterrows():
-        
-        try:
-            nome_cliente = str(row[COLUNA_CLIENTE]).strip()
-        except:
-            continue
-        
-        # Pula vazios
-        if not nome_cliente or nome_cliente.lower() == 'nan': 
-            continue
-
-        # index+1 dá o número real da linha do Excel (pois o índice original é preservado)
-        print(f"\nVerificando [Linha {index+1}]: {nome_cliente}")
-        
-        # 1. Realiza a pesquisa na grid
-        if realizar_pesquisa(page, nome_cliente):
-            time.sleep(2) # Tempo para a grid filtrar
-            
-            # 2. Verifica o status visualmente
-            resultado = verificar_status_na_linha(page, nome_cliente)
-            
-            print(f"   -> Status: {resultado}")
-            
-            # 3. Salva no TXT
-            escrever_relatorio(f"[Linha {index+1}] {nome_cliente}: {resultado}")
-            
-        else:
-            print("   -> [ERRO] Falha ao tentar pesquisar na barra.")
-            escrever_relatorio(f"[Linha {index+1}] {nome_cliente}: ERRO DE PESQUISA (Barra não encontrada)")
-
-        # Limpa o foco para a próxima iteração
-        page.bring_to_front()
+    if perguntar_modo() == "lote":
+        # Uma passada pela grid cobre a planilha inteira (os workers não se aplicam)
+        for index, resultado in auditar_em_lote(page, df_processamento):
+            registrar(index, resultado)
+    else:
+        # Serial na própria aba (1 worker) ou dividido entre N navegadores logados
+        # (com N, as linhas entram no TXT na ordem em que terminam; cada uma traz o nº da linha)
+        paralelo.executar(page, df_processamento, sys.modules[__name__], None, n_workers, ao_concluir=registrar)
 
     print(f"\n--> Auditoria finalizada. Verifique o arquivo: {ARQUIVO_RELATORIO}")
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+import sys
 import config
 from playwright.sync_api import BrowserContext
 
@@ -26,6 +27,38 @@ def configurar_contexto(playwright_instance) -> BrowserContext:
     
     return context
 
+def configurar_contexto_worker(playwright_instance, estado_autenticado) -> BrowserContext:
+    """
+    Navegador extra para o modo paralelo: contexto comum (não persistente) que
+    já nasce logado com o storage_state da sessão principal.
+    """
+    headless_mode = esta_no_docker()
+    args_navegador = ["--start-maximized"] if not headless_mode else ["--no-sandbox", "--disable-setuid-sandbox"]
+
+    browser = playwright_instance.chromium.launch(headless=headless_mode, args=args_navegador)
+    if headless_mode:
+        return browser.new_context(storage_state=estado_autenticado, viewport={'width': 1920, 'height': 1080})
+    return browser.new_context(storage_state=estado_autenticado, no_viewport=True)
+
+def perguntar_workers():
+    """
+    Quantos navegadores processam a planilha em paralelo.
+    Ordem: 2º argumento da linha de comando, variável WORKERS, pergunta no terminal.
+    """
+    valor = sys.argv[2] if len(sys.argv) > 2 else os.getenv("WORKERS")
+    if valor is None:
+        try:
+            valor = input("Quantos navegadores em paralelo? (Enter = 1): ")
+        except EOFError:
+            valor = ""
+    try:
+        n_workers = max(1, int(valor)) if str(valor).strip() else 1
+    except ValueError:
+        print("--> [AVISO] Quantidade inválida. Usando 1 navegador.")
+        n_workers = 1
+    print(f"--> [CONFIG] Navegadores em paralelo: {n_workers}")
+    return n_workers
+
 # --- NOVA FUNÇÃO GLOBAL ---
 def fatiar_dataframe(df):
     """
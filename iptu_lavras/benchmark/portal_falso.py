@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Portal de IPTU falso para benchmark offline. Serve uma página com os mesmos
+seletores do portal de Lavras (input 'Código Reduzido', iframe do reCAPTCHA,
+botão .gwt-SubmitButton, tabela com 'Emitir 2ª Via PDF') e o endpoint PUT
+getExtratoIPTU com latência configurável.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGINA = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Portal Cidadão (falso)</title></head>
+<body>
+  <div>Código Reduzido</div><input class="form-control" id="codigo">
+  <iframe src="/recaptcha/api2/anchor" width="300" height="80"></iframe>
+  <button class="gwt-SubmitButton" onclick="consultar()">Consultar</button>
+  <table id="extrato"></table>
+  <script>
+    async function consultar() {
+      const codigo = document.getElementById('codigo').value;
+      const r = await fetch('/portalcidadao/getExtratoIPTU', {
+        method: 'PUT', headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({codigoReduzido: codigo})
+      });
+      const tabela = document.getElementById('extrato');
+      tabela.innerHTML = '';
+      if (r.status !== 200) return;
+      const dados = await r.json();
+      for (const p of dados.guia[0].parcelaIPTU) {
+        if (p.linhaDigitavel.toUpperCase().includes('GUIA PAGA')) continue;
+        const venc = p.vencimento.replaceAll('-', '/');
+        const valor = p.totalParcela.toFixed(2).replace('.', ',');
+        tabela.insertAdjacentHTML('beforeend',
+          `<tr><td>${p.ano}</td><td>${p.numero}</td><td>${venc}</td><td>${valor}</td>` +
+          `<td><a href="/boleto/${codigo}/${p.numero}.pdf" download>Emitir 2ª Via PDF</a></td></tr>`);
+      }
+    }
+  </script>
+</body></html>"""
+
+ANCORA_RECAPTCHA = """<!DOCTYPE html><html><body>
+<span id="recaptcha-anchor" aria-checked="true"><span class="recaptcha-checkbox-border"></span></span>
+</body></html>"""
+
+
+def gerar_extrato(codigo, parcelas=4, proporcao_sem_debito=0.2):
+    """Extrato determinístico por código: parte sem débitos (204), parte paga, parte em aberto."""
+    rnd = random.Random(str(codigo))
+    if rnd.random() < proporcao_sem_debito:
+        return None
+    lista = []
+    for numero in range(1, parcelas + 1):
+        paga = rnd.random() < 0.5
+        lista.append({
+            "ano": 2025,
+            "numero": numero,
+            "totalParcela": round(rnd.uniform(50, 900), 2),
+            "vencimento": f"{10:02d}-{numero:02d}-2025",
+            "vencOriginal": f"{10:02d}-{numero:02d}-2025",
+            "linhaDigitavel": "GUIA PAGA" if paga else f"8160000{codigo}{numero:03d}",
+        })
+    return {"guia": [{"parcelaIPTU": lista}]}
+
+
+def gerar_pdf(codigo, parcela, tamanho_kb=40):
+    cabecalho = f"%PDF-1.4\n% boleto {codigo}/{parcela}\n".encode()
+    return cabecalho + b"0" * (tamanho_kb * 1024)
+
+
+class PortalFalso:
+    def __init__(self, latencia_ms=300, latencia_pdf_ms=100, parcelas=4, host="127.0.0.1", porta=0):
+        self.latencia = latencia_ms / 1000
+        self.latencia_pdf = latencia_pdf_ms / 1000
+        self.parcelas = parcelas
+        self.consultas = 0
+        self.downloads = 0
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, corpo=b"", tipo="text/html; charset=utf-8", extras=None):
+                self.send_response(status)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(corpo)))
+                for chave, valor in (extras or {}).items():
+                    self.send_header(chave, valor)
+                self.end_headers()
+                if corpo:
+                    self.wfile.write(corpo)
+
+            def do_GET(self):
+                if self.path.startswith("/recaptcha/api2/anchor"):
+                    return self._responder(200, ANCORA_RECAPTCHA.encode())
+                if self.path.startswith("/boleto/"):
+                    time.sleep(portal.latencia_pdf)
+                    portal.downloads += 1
+                    _, _, codigo, arquivo = self.path.split("/", 3)
+                    return self._responder(
+                        200, gerar_pdf(codigo, arquivo.split(".")[0]), "application/pdf",
+                        {"Content-Disposition": f'attachment; filename="{codigo}_{arquivo}"'},
+                    )
+                return self._responder(200, PAGINA.encode())
+
+            def do_PUT(self):
+                if "getExtratoIPTU" not in self.path:
+                    return self._responder(404)
+                tamanho = int(self.headers.get("Content-Length", 0))
+                corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+                time.sleep(portal.latencia)
+                portal.consultas += 1
+                extrato = gerar_extrato(corpo.get("codigoReduzido"), portal.parcelas)
+                if extrato is None:
+                    return self._responder(204)
+                return self._responder(200, json.dumps(extrato).encode(), "application/json")
+
+        self.servidor = ThreadingHTTPServer((host, porta), Handler)
+        self.url = f"http://{host}:{self.servidor.server_address[1]}/portalcidadao/"
+
+    def __enter__(self):
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+        return False
+
+
+if __name__ == "__main__":
+    with PortalFalso() as portal:
+        print(f"Portal falso em {portal.url} (Ctrl+C para sair)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
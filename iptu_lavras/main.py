@@ -1,169 +1,51 @@
+"""
+Robô de extração de IPTU - Lavras.
+
+Uso:
+    python main.py                          # processa a fila (agendamento), igual a 'executar'
+    python main.py executar --workers 4 [--todos]
+    python main.py imovel 123456            # reprocessa um imóvel sob demanda
+    python main.py lista 123 456 --arquivo codigos.txt --faixa 1000 1099
+    python main.py simular                  # mostra o que entraria na fila, sem navegador
+    python main.py status                   # relatório do banco
+
+Os módulos pesados (SQLAlchemy, Playwright, reconhecimento de áudio) só são
+importados pelos comandos que precisam deles.
+"""
 import sys
 import os
-import copy
-import time  # <--- IMPORTANTE: Adicionado para o sleep
+import argparse
 from datetime import datetime
 from dotenv import load_dotenv
-from sqlalchemy import text
-from loguru import logger 
-
-from src.database import DatabaseHandler, Imovel, DebitoIPTU
-from src.core.scraper import IPTUScraper
+from loguru import logger
 
 load_dotenv()
 
-# --- CONFIGURAÇÃO DO LOGGER ---
-logger.remove()
-logger.add(sys.stderr, format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>")
-os.makedirs("logs", exist_ok=True)
-logger.add(
-    "logs/robo_iptu_{time:YYYY-MM-DD}.log", 
-    rotation="00:00",      
-    level="INFO",          
-    encoding="utf-8"
-)
-# ------------------------------
-
-# Função auxiliar para formatar datas (DD-MM-YYYY -> YYYY-MM-DD)
-def converter_data(data_str):
-    if not data_str: return None
-    try:
-        # Transforma "24-12-2025" em objeto data e depois em "2025-12-24"
-        return datetime.strptime(data_str, "%d-%m-%Y").strftime("%Y-%m-%d")
-    except:
-        # Se der erro (ex: data já formatada ou texto estranho), retorna como veio
-        return data_str
+COMANDOS = ("executar", "imovel", "lista", "simular", "status")
 
-def processar_imovel(session, scraper, codigo_reduzido):
-    try:
-        # 1. Busca ou Cria Imóvel no Banco
-        imovel = session.query(Imovel).filter_by(codigo_reduzido=str(codigo_reduzido)).first()
-        if not imovel:
-            imovel = Imovel(codigo_reduzido=str(codigo_reduzido))
-            session.add(imovel)
-            session.commit()
-            logger.debug(f"[{codigo_reduzido}] Imóvel criado no banco.")
-
-        # ==============================================================================
-        # LÓGICA DE RETENTATIVA (RETRY) - 3 TENTATIVAS
-        # ==============================================================================
-        dados_com_bytes = None
-        tentativa_atual = 1
-        max_tentativas = 3
-
-        while tentativa_atual <= max_tentativas:
-            # Tenta extrair dados
-            dados_com_bytes = scraper.extrair_dados(codigo_reduzido)
-
-            if dados_com_bytes:
-                # SUCESSO: Dados obtidos, sai do loop imediatamente
-                break
-            else:
-                # FALHA: Loga e prepara para tentar de novo
-                logger.warning(f"[{codigo_reduzido}] Falha na tentativa {tentativa_atual}/{max_tentativas}.")
-                
-                if tentativa_atual < max_tentativas:
-                    tempo_espera = 5
-                    logger.info(f"[{codigo_reduzido}] Aguardando {tempo_espera}s para tentar novamente...")
-                    time.sleep(tempo_espera)
-                
-                tentativa_atual += 1
-        
-        # Se saiu do loop e a variável continua vazia, falhou todas as vezes
-        if not dados_com_bytes:
-            logger.error(f"[{codigo_reduzido}] ❌ FALHA TOTAL. Esgotadas {max_tentativas} tentativas.")
-            imovel.status = "ERRO_SCRAPER"
-            session.commit()
-            return False
-        # ==============================================================================
-
-        # 2. Tratamento para Comparação (Remove bytes do PDF para não quebrar a lógica de igualdade)
-        dados_limpos_novos = copy.deepcopy(dados_com_bytes)
-        if "guia" in dados_limpos_novos:
-            for guia in dados_limpos_novos["guia"]:
-                for parcela in guia.get("parcelaIPTU", []):
-                    if "blob_pdf" in parcela:
-                        del parcela["blob_pdf"]
-
-        # 3. Válvula de Escape (FORCE_UPDATE)
-        forcar_atualizacao = os.getenv("FORCE_UPDATE", "false").lower() == "true"
-
-        # Verifica Cache: Se não for para forçar E os dados forem iguais, pula.
-        if not forcar_atualizacao and imovel.dados_brutos == dados_limpos_novos:
-            imovel.data_atualizacao = datetime.now()
-            imovel.status = "SEM_MUDANCA"
-            session.commit()
-            logger.info(f"[{codigo_reduzido}] Sem alterações identificadas (Cache).")
-            return True
-
-        if forcar_atualizacao:
-            logger.warning(f"[{codigo_reduzido}] Ignorando cache (FORCE_UPDATE=true)...")
-
-        # 4. Auditoria (Salva o JSON bruto novo)
-        imovel.dados_brutos = dados_limpos_novos
-        imovel.data_atualizacao = datetime.now()
-        imovel.status = "PROCESSANDO"
-        session.commit()
-
-        # 5. Processamento dos Débitos (Salva na tabela filha)
-        if "guia" in dados_com_bytes:
-            lista_parcelas = dados_com_bytes["guia"][0].get("parcelaIPTU", [])
-            
-            # Limpa débitos antigos deste imóvel
-            session.query(DebitoIPTU).filter_by(imovel_id=imovel.id).delete()
-            
-            debitos_para_adicionar = []
-
-            for p in lista_parcelas:
-                linha_dig = p.get("linhaDigitavel", "").upper()
-                
-                # Define a situação baseada no PDF ou Texto
-                conteudo_binario = p.get('blob_pdf')
-                situacao_parcela = "Aberto"
-                
-                if conteudo_binario:
-                    situacao_parcela = "Aberto"
-                elif "GUIA PAGA" in linha_dig:
-                    situacao_parcela = "Quitado"
-                elif "CANCELADO" in linha_dig or "NÃO RECEBER" in linha_dig:
-                    situacao_parcela = "Cancelado"
-                else:
-                    situacao_parcela = "Indefinido"
-
-                # Cria o objeto Débito
-                novo_debito = DebitoIPTU(
-                    ano=p.get('ano'),
-                    parcela=p.get('numero'),
-                    valor=p.get('totalParcela'),
-                    
-                    # Usa a função auxiliar para converter data BR -> SQL
-                    vencimento=converter_data(p.get('vencimento')), 
-                    vencimento_original=converter_data(p.get('vencOriginal')), 
-                    
-                    situacao=situacao_parcela,
-                    boleto_pdf=conteudo_binario,
-                    imovel=imovel
-                )
-                debitos_para_adicionar.append(novo_debito)
-
-            if debitos_para_adicionar:
-                session.add_all(debitos_para_adicionar)
-                imovel.status = "SUCESSO"
-                logger.success(f"[{codigo_reduzido}] Atualizado com sucesso: {len(debitos_para_adicionar)} débitos.")
-            else:
-                imovel.status = "SEM_DEBITOS"
-                logger.info(f"[{codigo_reduzido}] Atualizado: Sem débitos pendentes.")
-            
-            session.commit()
-
-        return True
 
-    except Exception as e:
-        session.rollback()
-        logger.exception(f"[{codigo_reduzido}] Falha Crítica no processamento.")
-        return False
+def configurar_logger(arquivo=True):
+    """Console sempre; arquivo diário em logs/ só para os comandos que processam imóveis."""
+    logger.remove()
+    logger.add(sys.stderr, format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>")
+    if arquivo:
+        os.makedirs("logs", exist_ok=True)
+        logger.add(
+            "logs/robo_iptu_{time:YYYY-MM-DD}.log",
+            rotation="00:00",
+            level="INFO",
+            encoding="utf-8"
+        )
+
+
+def conectar_banco(workers=1, migrar=True):
+    """
+    migrar=False: só conecta (comandos de consulta como 'simular' e 'status' não
+    criam tabelas nem rodam as MIGRACOES, que alteram schema e dados).
+    """
+    from sqlalchemy import text
+    from src.database import DatabaseHandler
 
-def main():
     # Verifica conexão
     db_conn = os.getenv("DB_CONNECTION")
     if not db_conn:
@@ -171,29 +53,282 @@ def main():
         sys.exit(1)
 
     try:
-        db = DatabaseHandler(db_conn)
-        db.init_db()
+        # Cada worker usa uma sessão própria: o pool precisa comportar todos
+        db = DatabaseHandler(db_conn, pool_size=max(5, workers + 1))
+        if migrar:
+            db.init_db()
         session = db.get_session()
         session.execute(text("SELECT 1"))
+        session.close()
         logger.info("Conexão com Banco de Dados estabelecida.")
     except Exception as e:
         logger.critical(f"Não foi possível conectar ao Banco de Dados: {e}")
         sys.exit(1)
+    return db
+
+
+def iniciar_metricas():
+    from src.metricas import metricas
+
+    # Métricas por etapa: endpoint para o Prometheus e/ou textfile do node_exporter
+    porta_metricas = os.getenv("METRICAS_PORTA")
+    if porta_metricas:
+        metricas.iniciar_servidor(int(porta_metricas))
+        logger.info(f"Métricas Prometheus em http://0.0.0.0:{porta_metricas}/metrics")
+
+
+def exportar_metricas():
+    """Resumo JSON da execução em logs/ e, se configurado, textfile Prometheus."""
+    from src.metricas import metricas
+
+    try:
+        caminho_resumo = f"logs/resumo_execucao_{datetime.now():%Y-%m-%d_%H%M%S}.json"
+        metricas.gravar_resumo_json(caminho_resumo)
+        textfile = os.getenv("METRICAS_TEXTFILE")
+        if textfile:
+            metricas.gravar_textfile(textfile)
+    except Exception:
+        logger.exception("Falha ao exportar métricas.")
+        return
 
+    resumo = metricas.resumo()
+    for etapa, r in resumo["etapas"].items():
+        logger.info(f"Etapa {etapa}: n={r['n']} p50={r['p50_ms']}ms p95={r['p95_ms']}ms total={r['total_s']}s")
+    if resumo["captcha_taxa_sucesso"] is not None:
+        logger.info(f"Taxa de sucesso do captcha: {resumo['captcha_taxa_sucesso']:.1%}")
+    logger.info(f"Resumo da execução gravado em {caminho_resumo}")
+
+
+def limpar_boletos(db):
+    from src.core.persistencia import limpar_boletos_orfaos
+
+    # PDFs que deixaram de ser referenciados (débitos regravados ou quitados)
+    session = db.get_session()
+    try:
+        removidos = limpar_boletos_orfaos(session)
+        if removidos:
+            logger.info(f"Boletos órfãos removidos: {removidos}.")
+    except Exception:
+        session.rollback()
+        logger.exception("Falha ao limpar boletos órfãos.")
+    finally:
+        session.close()
+
+
+# --- COMANDOS ---
+def comando_executar(args):
+    from src.core.workers import PoolWorkers
+    from src.core.agendador import Agendador
+    from src.core.fila import FilaImoveis
+    from src.core.execucao import ControleExecucao
+    from src.core.processamento import processar_imovel
+
+    db = conectar_banco(args.workers)
     url = os.getenv("URL_ALVO")
     logger.info(f"Iniciando robô alvo: {url}")
-    
-    scraper = IPTUScraper(url)
-    
-    # Pega todos os imóveis para processar
-    todos_imoveis = session.query(Imovel).all()
-    logger.info(f"Fila de processamento: {len(todos_imoveis)} imóveis.")
-    
-    for imovel in todos_imoveis:
-        processar_imovel(session, scraper, imovel.codigo_reduzido)
-    
-    session.close()
+
+    # Fila distribuída no banco: por prioridade/intervalo de atualização, ou todos os imóveis (--todos).
+    # Vários processos/containers podem rodar ao mesmo tempo sem repetir imóveis.
+    # Livro de execuções: após uma queda, a próxima invocação retoma o mesmo ciclo
+    # e pula os imóveis já concluídos nele.
+    controle = ControleExecucao(db, modo="todos" if args.todos else "agendado")
+    execucao_id = controle.abrir()
+    fila = FilaImoveis(agendador=None if args.todos else Agendador(), execucao_id=execucao_id)
+
+    iniciar_metricas()
+    pool = PoolWorkers(db, url, args.workers, processar_imovel)
+    estatisticas = pool.executar(fila)
+    total = sum(s["processados"] for s in estatisticas.values())
+    logger.info(f"Workers finalizados: {total} imóveis processados.")
+
+    # O ciclo só é concluído quando a fila se esgota (parada por sinal/queda mantém aberto)
+    session = db.get_session()
+    try:
+        restantes = fila.restantes(session)
+    except Exception:
+        logger.exception("Falha ao contar imóveis restantes do ciclo.")
+        restantes = None
+    finally:
+        session.close()
+    controle.encerrar(restantes)
+
+    limpar_boletos(db)
+    exportar_metricas()
     logger.info("Processamento finalizado.")
 
+
+def _ler_codigos(args):
+    """Códigos avulsos + arquivo (um por linha, '#' comenta) + faixa numérica, sem repetir."""
+    codigos = list(getattr(args, "codigos", None) or [])
+    if getattr(args, "arquivo", None):
+        with open(args.arquivo, encoding="utf-8") as f:
+            codigos.extend(linha.split("#")[0].strip() for linha in f)
+    if getattr(args, "faixa", None):
+        inicio, fim = args.faixa
+        codigos.extend(str(c) for c in range(inicio, fim + 1))
+    return list(dict.fromkeys(c for c in codigos if c))
+
+
+def comando_lista(args):
+    from src.core.workers import PoolWorkers
+    from src.core.fila import FilaLista
+    from src.core.processamento import processar_imovel
+    from src.database import Imovel
+
+    codigos = _ler_codigos(args)
+    if not codigos:
+        logger.error("Nenhum código informado.")
+        sys.exit(2)
+    if args.forcar:
+        # Lido pelo GravadorLote a cada lote: regrava mesmo sem mudança no extrato
+        os.environ["FORCE_UPDATE"] = "true"
+
+    db = conectar_banco(args.workers)
+
+    if args.faixa:
+        # A faixa só seleciona imóveis já cadastrados (códigos avulsos criam o imóvel se faltar)
+        avulsos = set(_ler_codigos(argparse.Namespace(codigos=args.codigos, arquivo=args.arquivo)))
+        session = db.get_session()
+        try:
+            cadastrados = set()
+            for i in range(0, len(codigos), 1000):
+                parte = codigos[i:i + 1000]
+                cadastrados.update(c for (c,) in session.query(Imovel.codigo_reduzido).filter(Imovel.codigo_reduzido.in_(parte)))
+        finally:
+            session.close()
+        codigos = [c for c in codigos if c in avulsos or c in cadastrados]
+
+    logger.info(f"Reprocessando {len(codigos)} imóvel(is) sob demanda.")
+    iniciar_metricas()
+    pool = PoolWorkers(db, os.getenv("URL_ALVO"), min(args.workers, len(codigos)) or 1, processar_imovel)
+    estatisticas = pool.executar(FilaLista(codigos))
+    sucesso = sum(s["sucesso"] for s in estatisticas.values())
+    falha = sum(s["falha"] for s in estatisticas.values())
+    logger.info(f"Concluído: {sucesso} ok / {falha} falhas.")
+
+    limpar_boletos(db)
+    exportar_metricas()
+    if falha:
+        sys.exit(1)
+
+
+def comando_imovel(args):
+    args.codigos = [args.codigo]
+    args.arquivo = None
+    args.faixa = None
+    args.workers = 1
+    comando_lista(args)
+
+
+def comando_simular(args):
+    """Dry-run: o que a fila entregaria agora, por classe, sem abrir navegador nem gravar nada."""
+    from sqlalchemy import func, true
+    from src.core.agendador import Agendador, ordem_fila
+    from src.database import Imovel
+
+    db = conectar_banco(migrar=False)
+    session = db.get_session()
+    try:
+        classes = [("todos", true())] if args.todos else Agendador().classes()
+        total = 0
+        print(f"{'Classe':<14}{'Imóveis':>10}  Primeiros códigos")
+        for nome, condicao in classes:
+            quantidade = session.query(func.count(Imovel.id)).filter(condicao).scalar()
+            exemplos = [
+                c for (c,) in session.query(Imovel.codigo_reduzido)
+                .filter(condicao)
+                .order_by(*ordem_fila())
+                .limit(args.exemplos)
+            ]
+            total += quantidade
+            print(f"{nome:<14}{quantidade:>10}  {', '.join(exemplos)}")
+        print(f"{'TOTAL':<14}{total:>10}")
+    finally:
+        session.close()
+
+
+def comando_status(args):
+    """Relatório rápido: imóveis por status, débitos em aberto e últimas execuções."""
+    from sqlalchemy import func
+    from src.database import Imovel, DebitoIPTU, Execucao
+
+    db = conectar_banco(migrar=False)
+    session = db.get_session()
+    try:
+        print("Imóveis por status:")
+        por_status = (
+            session.query(Imovel.status, func.count(Imovel.id), func.max(Imovel.data_atualizacao))
+            .group_by(Imovel.status)
+            .order_by(func.count(Imovel.id).desc())
+        )
+        for status, quantidade, ultima in por_status:
+            print(f"  {status or '-':<16}{quantidade:>10}   última atualização: {ultima or '-'}")
+
+        abertos, valor, vencidos = session.query(
+            func.count(DebitoIPTU.id),
+            func.coalesce(func.sum(DebitoIPTU.valor), 0),
+            func.count(DebitoIPTU.id).filter(DebitoIPTU.vencimento < datetime.now().date()),
+        ).filter(DebitoIPTU.situacao == "Aberto").one()
+        print(f"Débitos em aberto: {abertos} (R$ {valor:,.2f}), {vencidos} vencidos.")
+
+        print("Últimas execuções:")
+        for e in session.query(Execucao).order_by(Execucao.id.desc()).limit(args.execucoes):
+            print(
+                f"  #{e.id:<5}{e.modo:<10}{e.status:<14}{e.iniciada_em:%Y-%m-%d %H:%M}  "
+                f"{e.invocacoes} invocação(ões), {(e.segundos_ativos or 0) / 60:.1f} min ativos"
+            )
+    finally:
+        session.close()
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Robô de extração de IPTU - Lavras")
+    sub = parser.add_subparsers(dest="comando")
+
+    p = sub.add_parser("executar", help="Processa a fila de imóveis (padrão)")
+    p.add_argument(
+        "--workers", type=int, default=int(os.getenv("WORKERS", "1")),
+        help="Quantidade de navegadores processando a fila em paralelo (padrão: 1)"
+    )
+    p.add_argument(
+        "--todos", action="store_true",
+        help="Ignora o agendamento e reprocessa todos os imóveis"
+    )
+    p.set_defaults(funcao=comando_executar, arquivo_log=True)
+
+    p = sub.add_parser("imovel", help="Reprocessa um único imóvel")
+    p.add_argument("codigo", help="Código reduzido do imóvel")
+    p.add_argument("--forcar", action="store_true", help="Regrava mesmo sem mudança no extrato")
+    p.set_defaults(funcao=comando_imovel, arquivo_log=True)
+
+    p = sub.add_parser("lista", help="Reprocessa uma lista e/ou faixa de códigos")
+    p.add_argument("codigos", nargs="*", help="Códigos reduzidos")
+    p.add_argument("--arquivo", help="Arquivo com um código por linha")
+    p.add_argument("--faixa", nargs=2, type=int, metavar=("INICIO", "FIM"), help="Faixa de códigos já cadastrados")
+    p.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "1")))
+    p.add_argument("--forcar", action="store_true", help="Regrava mesmo sem mudança no extrato")
+    p.set_defaults(funcao=comando_lista, arquivo_log=True)
+
+    p = sub.add_parser("simular", help="Mostra o que entraria na fila agora (dry-run)")
+    p.add_argument("--todos", action="store_true")
+    p.add_argument("--exemplos", type=int, default=5, help="Códigos listados por classe")
+    p.set_defaults(funcao=comando_simular, arquivo_log=False)
+
+    p = sub.add_parser("status", help="Relatório de status do banco")
+    p.add_argument("--execucoes", type=int, default=5, help="Quantas execuções listar")
+    p.set_defaults(funcao=comando_status, arquivo_log=False)
+    return parser
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    # Compatibilidade: sem subcomando (ex: 'python main.py --workers 4') = executar
+    if not argv or (argv[0] not in COMANDOS and argv[0] not in ("-h", "--help")):
+        argv.insert(0, "executar")
+
+    args = criar_parser().parse_args(argv)
+    configurar_logger(arquivo=args.arquivo_log)
+    args.funcao(args)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, not_, exists
+
+from src.database import Imovel, DebitoIPTU
+
+# Status que indicam imóvel ainda não consultado com sucesso
+STATUS_PRIORITARIOS = ("PENDENTE", "ERRO_SCRAPER")
+
+
+def ordem_fila():
+    """Ordem dentro de cada classe: os atualizados há mais tempo primeiro (id desempata)."""
+    return (Imovel.data_atualizacao.asc().nullsfirst(), Imovel.id)
+
+
+def _horas_env(nome, padrao):
+    return timedelta(hours=float(os.getenv(nome, padrao)))
+
+
+class Agendador:
+    """
+    Decide quais imóveis entram na fila e em que ordem, por classe de prioridade:
+      1. novos / ERRO_SCRAPER      -> sempre
+      2. débito aberto vencendo    -> a cada INTERVALO_VENCENDO_HORAS
+      3. demais com débito aberto  -> a cada INTERVALO_ABERTOS_HORAS
+      4. sem débitos / estáveis    -> a cada INTERVALO_ESTAVEIS_HORAS
+    Dentro de cada classe, os atualizados há mais tempo vêm primeiro.
+    """
+
+    def __init__(self, intervalos=None, janela_vencimento_dias=None):
+        self.intervalos = intervalos or {
+            "prioritarios": timedelta(0),
+            "vencendo": _horas_env("INTERVALO_VENCENDO_HORAS", "24"),
+            "abertos": _horas_env("INTERVALO_ABERTOS_HORAS", "72"),
+            "estaveis": _horas_env("INTERVALO_ESTAVEIS_HORAS", "720"),
+        }
+        if janela_vencimento_dias is None:
+            janela_vencimento_dias = int(os.getenv("JANELA_VENCIMENTO_DIAS", "15"))
+        self.janela_vencimento = timedelta(days=janela_vencimento_dias)
+
+    def classes(self, agora=None):
+        """Lista ordenada de (nome, condição SQL) — as condições são mutuamente exclusivas."""
+        agora = agora or datetime.now()
+        limite_vencimento = (agora + self.janela_vencimento).date()
+
+        prioritario = or_(Imovel.status.is_(None), Imovel.status.in_(STATUS_PRIORITARIOS))
+        tem_aberto = exists().where(and_(
+            DebitoIPTU.imovel_id == Imovel.id,
+            DebitoIPTU.situacao == "Aberto",
+        ))
+        vencendo = exists().where(and_(
+            DebitoIPTU.imovel_id == Imovel.id,
+            DebitoIPTU.situacao == "Aberto",
+            DebitoIPTU.vencimento <= limite_vencimento,
+        ))
+
+        definicoes = [
+            ("prioritarios", prioritario),
+            ("vencendo", and_(not_(prioritario), vencendo)),
+            ("abertos", and_(not_(prioritario), not_(vencendo), tem_aberto)),
+            ("estaveis", and_(not_(prioritario), not_(tem_aberto))),
+        ]
+        return [(nome, self._vencido(condicao, nome, agora)) for nome, condicao in definicoes]
+
+    def _vencido(self, condicao, nome, agora):
+        """Acrescenta à classe o filtro de 'já passou do intervalo de atualização'."""
+        intervalo = self.intervalos[nome]
+        if not intervalo:
+            return condicao
+        return and_(condicao, or_(
+            Imovel.data_atualizacao.is_(None),
+            Imovel.data_atualizacao < agora - intervalo,
+        ))
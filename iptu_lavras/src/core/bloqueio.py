@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+from urllib.parse import urlparse
+
+# Tipos de recurso que o robô nunca lê (imagens, fontes, mídia)
+TIPOS_BLOQUEADOS_PADRAO = "image,font,media"
+# Terceiros sem utilidade para a consulta (analytics/ads)
+DOMINIOS_BLOQUEADOS_PADRAO = "google-analytics.com,googletagmanager.com,doubleclick.net,facebook.net,hotjar.com"
+# Nunca bloqueados: o reCAPTCHA precisa de tudo (inclusive imagens/CSS) para funcionar
+DOMINIOS_PERMITIDOS_SEMPRE = ("google.com/recaptcha", "gstatic.com/recaptcha", "recaptcha.net")
+# Rota só para o que não é reCAPTCHA: no Playwright síncrono o handler da rota só roda
+# quando a thread está dentro de uma chamada do Playwright; requisição interceptada fica
+# parada enquanto o robô está em time.sleep/processando (o XHR de verificação travaria)
+PADRAO_ROTA = re.compile(
+    r"^(?!.*(?:" + "|".join(re.escape(d) for d in DOMINIOS_PERMITIDOS_SEMPRE) + r")).*",
+    re.IGNORECASE,
+)
+
+
+def _lista_env(nome, padrao):
+    return [item.strip().lower() for item in os.getenv(nome, padrao).split(",") if item.strip()]
+
+
+class PerfilBloqueio:
+    """
+    Intercepta as requisições do contexto (context.route) e aborta tipos de recurso
+    e domínios desnecessários, mantendo o app GWT, o reCAPTCHA e o getExtratoIPTU.
+    Conta, por imóvel, requisições evitadas e bytes efetivamente baixados.
+    """
+
+    def __init__(self, tipos=None, dominios=None):
+        self.tipos = set(tipos if tipos is not None else _lista_env("BLOQUEAR_TIPOS", TIPOS_BLOQUEADOS_PADRAO))
+        self.dominios = list(dominios if dominios is not None else _lista_env("BLOQUEAR_DOMINIOS", DOMINIOS_BLOQUEADOS_PADRAO))
+        self.zerar_medicao()
+
+    def zerar_medicao(self):
+        self.bloqueadas = 0
+        self.bloqueadas_por_tipo = {}
+        self.permitidas = 0
+        self.bytes_recebidos = 0
+
+    def medicao(self):
+        return {
+            "requisicoes_bloqueadas": self.bloqueadas,
+            "bloqueadas_por_tipo": dict(self.bloqueadas_por_tipo),
+            "requisicoes_permitidas": self.permitidas,
+            "bytes_recebidos": self.bytes_recebidos,
+        }
+
+    def instalar(self, context):
+        context.route(PADRAO_ROTA, self._rotear)
+        context.on("response", self._contar_bytes)
+
+    def deve_bloquear(self, url, tipo):
+        url = url.lower()
+        if any(permitido in url for permitido in DOMINIOS_PERMITIDOS_SEMPRE):
+            return False
+        host = urlparse(url).hostname or ""
+        if any(host == d or host.endswith("." + d) for d in self.dominios):
+            return True
+        return tipo in self.tipos
+
+    def _rotear(self, route):
+        request = route.request
+        tipo = request.resource_type
+        if self.deve_bloquear(request.url, tipo):
+            self.bloqueadas += 1
+            self.bloqueadas_por_tipo[tipo] = self.bloqueadas_por_tipo.get(tipo, 0) + 1
+            route.abort()
+        else:
+            self.permitidas += 1
+            route.continue_()
+
+    def _contar_bytes(self, response):
+        try:
+            self.bytes_recebidos += int(response.headers.get("content-length", 0))
+        except (TypeError, ValueError):
+            pass
+
+
+def criar_perfil_bloqueio():
+    """BLOQUEIO_RECURSOS=false desliga a interceptação (útil para comparar o consumo)."""
+    if os.getenv("BLOQUEIO_RECURSOS", "true").lower() != "true":
+        return None
+    return PerfilBloqueio()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import tempfile
+import zlib
+
+# Leitura/cópia dos PDFs em partes (nunca o arquivo inteiro de uma vez)
+TAMANHO_PARTE = 64 * 1024
+
+
+def _limite_memoria():
+    # Acima disso o buffer do PDF vai para um arquivo temporário em disco
+    return int(os.getenv("LIMITE_PDF_MEMORIA_KB", "64")) * 1024
+
+
+class BoletoSpool:
+    """
+    PDF de um boleto guardado num SpooledTemporaryFile: fica em memória até
+    LIMITE_PDF_MEMORIA_KB e depois transborda para disco. O SHA-256 e o tamanho
+    são calculados durante a cópia, sem materializar o PDF em 'bytes'.
+    """
+
+    def __init__(self):
+        self._arquivo = tempfile.SpooledTemporaryFile(max_size=_limite_memoria())
+        self._hash = hashlib.sha256()
+        self.tamanho = 0
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        """Copia o download do navegador (arquivo temporário do Playwright) para o spool."""
+        boleto = cls()
+        with open(caminho, "rb") as origem:
+            while True:
+                parte = origem.read(TAMANHO_PARTE)
+                if not parte:
+                    break
+                boleto.escrever(parte)
+        return boleto
+
+    def escrever(self, parte):
+        self._arquivo.write(parte)
+        self._hash.update(parte)
+        self.tamanho += len(parte)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def __len__(self):
+        # Permite 'if parcela.get("blob_pdf")' continuar valendo para PDF vazio
+        return self.tamanho
+
+    def partes(self, tamanho_parte=TAMANHO_PARTE):
+        self._arquivo.seek(0)
+        while True:
+            parte = self._arquivo.read(tamanho_parte)
+            if not parte:
+                break
+            yield parte
+
+    def comprimir(self):
+        """
+        zlib em streaming a partir do spool. Só o resultado comprimido de um PDF
+        por vez fica em memória (é o valor do INSERT em 'boletos_pdf').
+        """
+        compressor = zlib.compressobj()
+        saida = [compressor.compress(parte) for parte in self.partes()]
+        saida.append(compressor.flush())
+        return b"".join(saida)
+
+    def ler(self):
+        return b"".join(self.partes())
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+def liberar_boletos(dados):
+    """Fecha os spools de PDF de um extrato (chamado depois da gravação ou de descarte)."""
+    if isinstance(dados, dict):
+        for chave, valor in dados.items():
+            if isinstance(valor, BoletoSpool):
+                valor.fechar()
+            else:
+                liberar_boletos(valor)
+    elif isinstance(dados, list):
+        for valor in dados:
+            liberar_boletos(valor)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from datetime import datetime, timedelta
+from loguru import logger
+from sqlalchemy import func
+
+from src.database import Execucao, ProgressoExecucao
+
+
+class ControleExecucao:
+    """
+    Livro de execuções: abre (ou retoma) o ciclo da fila e, ao final, registra
+    o tempo ativo e fecha o ciclo quando não restar imóvel a processar.
+    Os imóveis concluídos ficam em 'execucoes_imoveis' (ver GravadorLote),
+    e a FilaImoveis não os entrega de novo enquanto o ciclo estiver aberto.
+    """
+
+    def __init__(self, db, modo, validade_horas=None):
+        self.db = db
+        self.modo = modo
+        # Ciclo aberto há mais tempo que isso não é retomado (os dados já envelheceram)
+        if validade_horas is None:
+            validade_horas = float(os.getenv("VALIDADE_EXECUCAO_HORAS", "24"))
+        self.validade = timedelta(hours=validade_horas)
+        self.execucao_id = None
+        self.retomada = False
+        self._inicio = None
+
+    def abrir(self):
+        session = self.db.get_session()
+        try:
+            execucao = (
+                session.query(Execucao)
+                .filter(Execucao.modo == self.modo, Execucao.status == "EM_ANDAMENTO")
+                .order_by(Execucao.id.desc())
+                .first()
+            )
+            if execucao is not None and execucao.iniciada_em < datetime.now() - self.validade:
+                logger.warning(f"Execução #{execucao.id} aberta desde {execucao.iniciada_em:%Y-%m-%d %H:%M} abandonada.")
+                execucao.status = "ABANDONADA"
+                execucao.finalizada_em = datetime.now()
+                execucao = None
+            self.retomada = execucao is not None
+            if execucao is None:
+                execucao = Execucao(modo=self.modo, segundos_ativos=0.0, invocacoes=0)
+                session.add(execucao)
+            execucao.invocacoes = (execucao.invocacoes or 0) + 1
+            session.commit()
+            self.execucao_id = execucao.id
+
+            if self.retomada:
+                feitos = self._contar_feitos(session)
+                logger.info(
+                    f"Retomando execução #{execucao.id} ({self.modo}, iniciada em "
+                    f"{execucao.iniciada_em:%Y-%m-%d %H:%M}): {feitos} imóveis já concluídos serão pulados."
+                )
+            else:
+                logger.info(f"Nova execução #{execucao.id} ({self.modo}).")
+        finally:
+            session.close()
+
+        self._inicio = time.monotonic()
+        return self.execucao_id
+
+    def encerrar(self, restantes):
+        """Acumula o tempo desta invocação; com a fila esgotada (restantes == 0), conclui o ciclo."""
+        session = self.db.get_session()
+        try:
+            execucao = session.get(Execucao, self.execucao_id)
+            execucao.segundos_ativos = (execucao.segundos_ativos or 0.0) + (time.monotonic() - self._inicio)
+            if restantes == 0:
+                execucao.status = "CONCLUIDA"
+                execucao.finalizada_em = datetime.now()
+            session.commit()
+            self._relatar(session, execucao, restantes)
+        except Exception:
+            session.rollback()
+            logger.exception(f"Falha ao registrar o fim da execução #{self.execucao_id}.")
+        finally:
+            session.close()
+
+    def _contar_feitos(self, session):
+        return (
+            session.query(func.count())
+            .select_from(ProgressoExecucao)
+            .filter(ProgressoExecucao.execucao_id == self.execucao_id)
+            .scalar()
+        )
+
+    def _relatar(self, session, execucao, restantes):
+        por_status = dict(
+            session.query(ProgressoExecucao.status, func.count())
+            .filter(ProgressoExecucao.execucao_id == self.execucao_id)
+            .group_by(ProgressoExecucao.status)
+            .all()
+        )
+        feitos = sum(por_status.values())
+        horas = (execucao.segundos_ativos or 0.0) / 3600
+        vazao = feitos / horas if horas else 0.0
+        situacao = "concluída" if execucao.status == "CONCLUIDA" else f"pendente ({restantes} imóveis restantes)"
+        logger.info(
+            f"Execução #{execucao.id} {situacao}: {feitos} imóveis em {execucao.invocacoes} invocação(ões), "
+            f"{execucao.segundos_ativos / 60:.1f} min ativos, {vazao:.1f} imóveis/hora. Por status: {por_status}"
+        )
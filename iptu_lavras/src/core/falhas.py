@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import threading
+import time
+from loguru import logger
+
+
+# --- FALHAS TIPADAS DO SCRAPER ---
+class FalhaScraper(Exception):
+    """Falha ao extrair um imóvel. 'portal_fora' indica sinal de portal fora do ar/limitando."""
+    classe = "desconhecida"
+    portal_fora = False
+
+
+class FalhaCaptcha(FalhaScraper):
+    classe = "captcha"
+
+
+class FalhaSeletor(FalhaScraper):
+    classe = "seletor"
+
+
+class FalhaNavegador(FalhaScraper):
+    classe = "navegador"
+
+
+class FalhaTimeout(FalhaScraper):
+    classe = "timeout"
+    portal_fora = True
+
+
+class FalhaRede(FalhaScraper):
+    classe = "rede"
+    portal_fora = True
+
+
+class FalhaHTTP(FalhaScraper):
+    classe = "http"
+
+    def __init__(self, status, mensagem=None):
+        super().__init__(mensagem or f"Portal respondeu HTTP {status}.")
+        self.status = status
+        # 5xx = portal com problema; 429 = estamos sendo limitados
+        self.portal_fora = status >= 500 or status == 429
+
+
+def classificar_erro(erro):
+    """Traduz exceções genéricas do Playwright em falhas tipadas."""
+    mensagem = str(erro)
+    if "Timeout" in type(erro).__name__ or "Timeout" in mensagem:
+        return FalhaTimeout(mensagem)
+    if "net::ERR" in mensagem:
+        return FalhaRede(mensagem)
+    if "closed" in mensagem or "crash" in mensagem.lower():
+        return FalhaNavegador(mensagem)
+    return FalhaScraper(mensagem)
+
+
+# --- POLÍTICAS DE RETENTATIVA ---
+class PoliticaRetry:
+    """Backoff exponencial com jitter total: espera aleatória em [0, min(teto, base * 2^(n-1))]."""
+
+    def __init__(self, max_tentativas, base, teto):
+        self.max_tentativas = max_tentativas
+        self.base = base
+        self.teto = teto
+
+    def espera(self, tentativa):
+        return random.uniform(0, min(self.teto, self.base * 2 ** (tentativa - 1)))
+
+
+POLITICAS_RETRY = {
+    "captcha": PoliticaRetry(max_tentativas=4, base=2, teto=20),
+    "seletor": PoliticaRetry(max_tentativas=2, base=2, teto=10),
+    "navegador": PoliticaRetry(max_tentativas=3, base=3, teto=30),
+    "timeout": PoliticaRetry(max_tentativas=3, base=10, teto=120),
+    "rede": PoliticaRetry(max_tentativas=3, base=10, teto=120),
+    "http": PoliticaRetry(max_tentativas=3, base=15, teto=300),
+    "desconhecida": PoliticaRetry(max_tentativas=3, base=5, teto=60),
+}
+
+
+def max_tentativas_total():
+    # Teto por imóvel somando todas as classes: falhas que alternam de tipo não
+    # acumulam as cotas de cada política (até ~21 tentativas com esperas longas)
+    return max(1, int(os.getenv("MAX_TENTATIVAS_TOTAL", "6")))
+
+
+# --- DISJUNTOR (CIRCUIT BREAKER) ---
+class DisjuntorPortal:
+    """
+    Compartilhado por todos os workers do processo. Após 'limiar' falhas seguidas
+    que indicam portal fora do ar, abre e pausa todo mundo. Passada a pausa, deixa
+    as consultas voltarem (meio-aberto): um sucesso fecha; uma nova falha reabre
+    com pausa dobrada, até 'pausa_maxima'.
+    """
+
+    def __init__(self, limiar=None, pausa=None, pausa_maxima=None):
+        self.limiar = limiar or int(os.getenv("DISJUNTOR_LIMIAR", "5"))
+        self.pausa_inicial = pausa or float(os.getenv("DISJUNTOR_PAUSA_S", "60"))
+        self.pausa_maxima = pausa_maxima or float(os.getenv("DISJUNTOR_PAUSA_MAX_S", "900"))
+        self.cancelar = threading.Event()  # setado no desligamento para não ficar preso em pausa
+        self._lock = threading.Lock()
+        self._falhas_seguidas = 0
+        self._pausa = self.pausa_inicial
+        self._aberto_ate = 0.0
+
+    def aguardar(self):
+        """Bloqueia enquanto o disjuntor estiver aberto. Retorna False se cancelado."""
+        while not self.cancelar.is_set():
+            with self._lock:
+                restante = self._aberto_ate - time.monotonic()
+            if restante <= 0:
+                return True
+            self.cancelar.wait(min(restante, 5))
+        return False
+
+    def registrar_sucesso(self):
+        with self._lock:
+            if self._falhas_seguidas >= self.limiar:
+                logger.info("Portal respondendo novamente. Disjuntor fechado.")
+            self._falhas_seguidas = 0
+            self._pausa = self.pausa_inicial
+
+    def registrar_falha(self, falha):
+        if not falha.portal_fora:
+            return
+        with self._lock:
+            self._falhas_seguidas += 1
+            if self._falhas_seguidas < self.limiar or time.monotonic() < self._aberto_ate:
+                return
+            self._aberto_ate = time.monotonic() + self._pausa
+            logger.warning(
+                f"Disjuntor aberto: {self._falhas_seguidas} falhas seguidas do portal "
+                f"({falha.classe}). Pausando todos os workers por {self._pausa:.0f}s."
+            )
+            self._pausa = min(self._pausa * 2, self.pausa_maxima)
+
+
+# Instância única do processo (todas as threads de worker consultam a mesma).
+# Criada sob demanda para ler as variáveis depois do load_dotenv().
+_disjuntor = None
+_disjuntor_lock = threading.Lock()
+
+
+def obter_disjuntor():
+    global _disjuntor
+    with _disjuntor_lock:
+        if _disjuntor is None:
+            _disjuntor = DisjuntorPortal()
+        return _disjuntor
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from loguru import logger
+from sqlalchemy import and_, exists, func, or_, true, update
+
+from src.database import Imovel, ProgressoExecucao
+from src.core.agendador import ordem_fila
+
+
+# Único por processo: no container o robô é sempre o PID 1 e o hostname sobrevive ao
+# restart, então host + PID repetiria o dono da execução que caiu
+_INSTANCIA = uuid.uuid4().hex[:12]
+
+
+def identificador_processo():
+    """Dono dos leases: host + PID + instância (distingue containers/hosts e reinícios)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{_INSTANCIA}"
+
+
+def _valores_lease(**valores):
+    """
+    Valores de um UPDATE de lease. Mantém data_atualizacao como está: sem isso o
+    'onupdate' da coluna carimba 'agora' e o imóvel parece recém-atualizado para o agendador.
+    """
+    return dict(valores, data_atualizacao=Imovel.data_atualizacao)
+
+
+class FilaImoveis:
+    """
+    Fila distribuída sobre a tabela 'imoveis'. Em vez de carregar tudo,
+    cada worker reivindica pequenos lotes com SELECT ... FOR UPDATE SKIP LOCKED,
+    em cada classe do agendador os atualizados há mais tempo primeiro, e marca
+    os imóveis com um lease que expira sozinho se o processo morrer. Enquanto o
+    processo vive, o lease é renovado (renovar), por mais que o imóvel demore.
+    Sem cursor: imóvel gravado sai do começo da ordem (data_atualizacao = agora)
+    e do ciclo; liberado ou de um host que caiu volta a ser reivindicado.
+    """
+
+    def __init__(self, agendador=None, dono=None, duracao_lease_min=None, execucao_id=None):
+        self.agendador = agendador  # None = todos os imóveis, uma única classe
+        # Ciclo em andamento (ver ControleExecucao): imóveis já concluídos nele não voltam à fila
+        self.execucao_id = execucao_id
+        self.dono = dono or identificador_processo()
+        if duracao_lease_min is None:
+            duracao_lease_min = int(os.getenv("DURACAO_LEASE_MIN", "30"))
+        self.duracao_lease = timedelta(minutes=duracao_lease_min)
+        # Renovação bem antes de expirar (ver PoolWorkers)
+        self.intervalo_renovacao = self.duracao_lease.total_seconds() / 3
+        # Sem livro de execuções: só entra quem não foi atualizado desde o início desta fila
+        self._inicio = datetime.now()
+        self._lock = threading.Lock()
+
+    def _classes(self, agora):
+        if self.agendador is None:
+            return [("todos", true())]
+        return self.agendador.classes(agora)
+
+    def _pendente_no_ciclo(self):
+        if self.execucao_id is None:
+            return or_(Imovel.data_atualizacao.is_(None), Imovel.data_atualizacao < self._inicio)
+        return ~exists().where(
+            ProgressoExecucao.execucao_id == self.execucao_id,
+            ProgressoExecucao.imovel_id == Imovel.id,
+        )
+
+    def proximos(self, session, quantidade):
+        """Reivindica até 'quantidade' imóveis livres, na ordem de prioridade."""
+        agora = datetime.now()
+        livre = and_(or_(Imovel.lease_ate.is_(None), Imovel.lease_ate < agora), self._pendente_no_ciclo())
+        reivindicados = []
+
+        # O lock evita que threads do mesmo processo disputem as mesmas linhas; a
+        # disputa entre processos/hosts é resolvida pelo SKIP LOCKED no banco.
+        with self._lock:
+            try:
+                for nome, condicao in self._classes(agora):
+                    faltam = quantidade - len(reivindicados)
+                    if faltam <= 0:
+                        break
+                    linhas = (
+                        session.query(Imovel.id, Imovel.codigo_reduzido)
+                        .filter(condicao, livre)
+                        .order_by(*ordem_fila())
+                        .limit(faltam)
+                        .with_for_update(skip_locked=True)
+                        .all()
+                    )
+                    reivindicados.extend(linhas)
+
+                if reivindicados:
+                    session.execute(
+                        update(Imovel)
+                        .where(Imovel.id.in_([linha.id for linha in reivindicados]))
+                        .values(_valores_lease(lease_ate=agora + self.duracao_lease, lease_dono=self.dono))
+                        .execution_options(synchronize_session=False)
+                    )
+                session.commit()
+            except Exception:
+                session.rollback()
+                logger.exception("Falha ao reivindicar imóveis da fila.")
+                return []
+
+        return [linha.codigo_reduzido for linha in reivindicados]
+
+    def restantes(self, session):
+        """Imóveis ainda não concluídos no ciclo (inclusive os reivindicados por outros processos)."""
+        condicoes = [condicao for _, condicao in self._classes(datetime.now())]
+        return (
+            session.query(func.count(Imovel.id))
+            .filter(or_(*condicoes), self._pendente_no_ciclo())
+            .scalar()
+        )
+
+    def renovar(self, session):
+        """
+        Estende todos os leases deste processo: os reivindicados ainda na fila do worker,
+        o que está em retentativa/pausa do disjuntor e os que aguardam o flush do lote.
+        """
+        try:
+            resultado = session.execute(
+                update(Imovel)
+                .where(Imovel.lease_dono == self.dono, Imovel.lease_ate.isnot(None))
+                .values(_valores_lease(lease_ate=datetime.now() + self.duracao_lease))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            logger.debug(f"Leases renovados: {resultado.rowcount}.")
+        except Exception:
+            session.rollback()
+            logger.exception("Falha ao renovar leases.")
+
+    def liberar(self, session, codigos):
+        """Devolve à fila imóveis reivindicados que não chegaram a ser processados."""
+        if not codigos:
+            return
+        try:
+            session.execute(
+                update(Imovel)
+                .where(Imovel.codigo_reduzido.in_([str(c) for c in codigos]), Imovel.lease_dono == self.dono)
+                .values(_valores_lease(lease_ate=None, lease_dono=None))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            logger.exception("Falha ao liberar leases.")
+
+
+class FilaLista:
+    """Fila em memória para uma lista explícita de códigos (mesma interface da FilaImoveis)."""
+
+    def __init__(self, codigos):
+        self._codigos = [str(c) for c in codigos]
+        self.execucao_id = None  # Lista avulsa não entra no livro de execuções
+        self.intervalo_renovacao = None  # Sem leases: nada a renovar
+        self._posicao = 0
+        self._lock = threading.Lock()
+
+    def proximos(self, session, quantidade):
+        with self._lock:
+            lote = self._codigos[self._posicao:self._posicao + quantidade]
+            self._posicao += len(lote)
+            return lote
+
+    def renovar(self, session):
+        pass
+
+    def liberar(self, session, codigos):
+        pass
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+
+# Chaves com conteúdo binário injetado pelo scraper (não fazem parte do "dado" do portal)
+CHAVES_BINARIAS = {"blob_pdf"}
+
+
+def sem_blobs(dados):
+    """
+    Devolve a mesma estrutura sem as chaves binárias. Só os dicts/listas são
+    recriados; os bytes dos PDFs nunca são copiados (ao contrário de um deepcopy).
+    """
+    if isinstance(dados, dict):
+        return {k: sem_blobs(v) for k, v in dados.items() if k not in CHAVES_BINARIAS}
+    if isinstance(dados, list):
+        return [sem_blobs(v) for v in dados]
+    return dados
+
+
+def calcular_fingerprint(dados):
+    """Hash SHA-256 estável do payload normalizado (chaves ordenadas, sem blobs)."""
+    canonico = json.dumps(
+        sem_blobs(dados), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
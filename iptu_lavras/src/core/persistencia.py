@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+import os
+from datetime import datetime
+from loguru import logger
+from sqlalchemy import delete, insert, select, update, exists
+
+from src.database import Imovel, DebitoIPTU, BoletoPDF, ProgressoExecucao
+from src.core.fingerprint import calcular_fingerprint, sem_blobs
+from src.core.boletos import liberar_boletos
+from src.metricas import metricas
+
+
+# Campos do débito comparados no upsert (a chave é ano + parcela)
+CAMPOS_DEBITO = ("valor", "vencimento", "vencimento_original", "situacao", "boleto_sha256")
+
+
+# Função auxiliar para converter datas do portal (DD-MM-YYYY -> date)
+def converter_data(data_str):
+    if not data_str: return None
+    for formato in ("%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            # Transforma "24-12-2025" em date(2025, 12, 24)
+            return datetime.strptime(data_str, formato).date()
+        except ValueError:
+            continue
+    # Texto estranho: melhor sem data do que uma data errada
+    logger.warning(f"Data em formato inesperado ignorada: {data_str!r}")
+    return None
+
+
+def _inteiro(valor):
+    """Ano/parcela podem vir como texto no JSON; a chave do upsert compara com o INTEGER do banco."""
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return valor
+
+
+def classificar_situacao(parcela):
+    """Define a situação baseada no PDF ou no texto da linha digitável."""
+    linha_dig = parcela.get("linhaDigitavel", "").upper()
+    if parcela.get("blob_pdf"):
+        return "Aberto"
+    if "GUIA PAGA" in linha_dig:
+        return "Quitado"
+    if "CANCELADO" in linha_dig or "NÃO RECEBER" in linha_dig:
+        return "Cancelado"
+    return "Indefinido"
+
+
+def insert_ignorando_conflito(session, modelo):
+    """INSERT que ignora chave já existente (outro worker pode ter gravado o mesmo PDF)."""
+    dialeto = session.get_bind().dialect.name
+    if dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialeto
+    elif dialeto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialeto
+    else:
+        return insert(modelo)
+    return insert_dialeto(modelo).on_conflict_do_nothing()
+
+
+def guardar_boletos(session, lista_parcelas):
+    """
+    Grava no 'boletos_pdf' os PDFs ainda não conhecidos (comprimidos, chave SHA-256)
+    e devolve, na ordem das parcelas, o hash de cada uma (None se não tiver PDF).
+    Os PDFs chegam como BoletoSpool (hash já calculado na cópia) e são comprimidos
+    e inseridos um de cada vez, para a memória não crescer com o número de parcelas.
+    """
+    por_sha = {}
+    referencias = []
+    for p in lista_parcelas:
+        boleto = p.get('blob_pdf')
+        if not boleto:
+            referencias.append(None)
+            continue
+        por_sha[boleto.sha256] = boleto
+        referencias.append(boleto.sha256)
+
+    if por_sha:
+        existentes = set(session.scalars(select(BoletoPDF.sha256).where(BoletoPDF.sha256.in_(list(por_sha)))))
+        for sha, boleto in por_sha.items():
+            if sha in existentes:
+                continue
+            session.execute(
+                insert_ignorando_conflito(session, BoletoPDF),
+                {"sha256": sha, "tamanho": boleto.tamanho, "conteudo": boleto.comprimir(), "criado_em": datetime.now()},
+            )
+
+    return referencias
+
+
+def limpar_boletos_orfaos(session):
+    """Remove PDFs que nenhum débito referencia mais. Retorna quantos foram apagados."""
+    referenciado = exists().where(DebitoIPTU.boleto_sha256 == BoletoPDF.sha256)
+    resultado = session.execute(delete(BoletoPDF).where(~referenciado))
+    session.commit()
+    return resultado.rowcount
+
+
+class GravadorLote:
+    """
+    Acumula os resultados do scraper e grava vários imóveis numa única transação.
+    Cada imóvel roda dentro de um SAVEPOINT: se um falhar, só ele é desfeito.
+    Os débitos entram por INSERT em massa (executemany do Core), sem objetos ORM.
+    """
+
+    def __init__(self, session, tamanho_lote=None, execucao_id=None):
+        self.session = session
+        # Com execução: cada imóvel gravado é marcado como concluído no ciclo, na mesma transação
+        self.execucao_id = execucao_id
+        if tamanho_lote is None:
+            tamanho_lote = int(os.getenv("TAMANHO_LOTE_DB", "20"))
+        self.tamanho_lote = max(1, tamanho_lote)
+        self._pendentes = []  # [(codigo_reduzido, dados_com_bytes | None)]
+
+    def registrar(self, codigo_reduzido, dados_com_bytes):
+        """Enfileira o resultado (None = falha do scraper) e grava quando o lote enche."""
+        self._pendentes.append((str(codigo_reduzido), dados_com_bytes))
+        if len(self._pendentes) >= self.tamanho_lote:
+            self.flush()
+
+    def flush(self):
+        if not self._pendentes:
+            return
+        with metricas.cronometro("db_lote"):
+            self._gravar_pendentes()
+
+    def _gravar_pendentes(self):
+        lote, self._pendentes = self._pendentes, []
+        forcar_atualizacao = os.getenv("FORCE_UPDATE", "false").lower() == "true"
+
+        try:
+            # Uma consulta para todos os imóveis do lote
+            codigos = [codigo for codigo, _ in lote]
+            imoveis = {
+                i.codigo_reduzido: i
+                for i in self.session.query(Imovel).filter(Imovel.codigo_reduzido.in_(codigos))
+            }
+
+            for codigo, dados in lote:
+                try:
+                    with self.session.begin_nested():
+                        imovel = imoveis.get(codigo)
+                        if imovel is None:
+                            imovel = Imovel(codigo_reduzido=codigo)
+                            self.session.add(imovel)
+                            self.session.flush()
+                            imoveis[codigo] = imovel
+                            logger.debug(f"[{codigo}] Imóvel criado no banco.")
+                        self._aplicar(imovel, dados, forcar_atualizacao)
+                except Exception:
+                    logger.exception(f"[{codigo}] Falha Crítica na gravação (desfeito via savepoint).")
+
+            with metricas.cronometro("db_commit"):
+                self.session.commit()
+            logger.debug(f"Lote gravado: {len(lote)} imóveis em uma transação.")
+        except Exception:
+            self.session.rollback()
+            logger.exception(f"Falha ao gravar lote de {len(lote)} imóveis.")
+        finally:
+            # Os PDFs já estão no banco (ou o lote falhou): libera os spools
+            for _, dados in lote:
+                liberar_boletos(dados)
+
+    def _aplicar(self, imovel, dados_com_bytes, forcar_atualizacao):
+        self._aplicar_dados(imovel, dados_com_bytes, forcar_atualizacao)
+        metricas.contar("imoveis", status=imovel.status)
+        if self.execucao_id is not None:
+            self.session.execute(
+                insert_ignorando_conflito(self.session, ProgressoExecucao),
+                [{"execucao_id": self.execucao_id, "imovel_id": imovel.id,
+                  "status": imovel.status, "concluido_em": datetime.now()}],
+            )
+
+    def _aplicar_dados(self, imovel, dados_com_bytes, forcar_atualizacao):
+        codigo_reduzido = imovel.codigo_reduzido
+
+        # Processado: devolve o imóvel à fila (o próximo ciclo decide pelo agendador)
+        imovel.lease_ate = None
+        imovel.lease_dono = None
+
+        if not dados_com_bytes:
+            imovel.status = "ERRO_SCRAPER"
+            return
+
+        # Fingerprint do payload (ignora os bytes dos PDFs sem copiá-los)
+        fingerprint_novo = calcular_fingerprint(dados_com_bytes)
+        fingerprint_atual = imovel.hash_conteudo
+        if fingerprint_atual is None and imovel.dados_brutos is not None:
+            # Registro anterior ao fingerprint: calcula uma vez a partir do JSON salvo
+            fingerprint_atual = calcular_fingerprint(imovel.dados_brutos)
+
+        # Verifica Cache: Se não for para forçar E os dados forem iguais, pula.
+        if not forcar_atualizacao and fingerprint_atual == fingerprint_novo:
+            imovel.hash_conteudo = fingerprint_novo
+            imovel.data_atualizacao = datetime.now()
+            imovel.status = "SEM_MUDANCA"
+            logger.info(f"[{codigo_reduzido}] Sem alterações identificadas (Cache).")
+            return
+
+        if forcar_atualizacao:
+            logger.warning(f"[{codigo_reduzido}] Ignorando cache (FORCE_UPDATE=true)...")
+
+        # Auditoria (Salva o JSON bruto novo)
+        imovel.dados_brutos = sem_blobs(dados_com_bytes)
+        imovel.hash_conteudo = fingerprint_novo
+        imovel.data_atualizacao = datetime.now()
+
+        if "guia" not in dados_com_bytes:
+            imovel.status = "SEM_DEBITOS"
+            return
+
+        # Processamento dos Débitos (Salva na tabela filha)
+        lista_parcelas = (dados_com_bytes["guia"] or [{}])[0].get("parcelaIPTU", [])
+
+        # PDFs vão para o armazenamento por conteúdo; o débito guarda só o hash
+        referencias_pdf = guardar_boletos(self.session, lista_parcelas)
+
+        novos = {}
+        for p, sha in zip(lista_parcelas, referencias_pdf):
+            chave = (_inteiro(p.get('ano')), _inteiro(p.get('numero')))
+            if chave in novos:
+                logger.warning(f"[{codigo_reduzido}] Parcela repetida no extrato {chave}; mantida a última.")
+            novos[chave] = {
+                "ano": chave[0],
+                "parcela": chave[1],
+                "valor": p.get('totalParcela'),
+                "vencimento": converter_data(p.get('vencimento')),
+                "vencimento_original": converter_data(p.get('vencOriginal')),
+                "situacao": classificar_situacao(p),
+                "boleto_sha256": sha,
+            }
+
+        inseridos, alterados, removidos = self._sincronizar_debitos(imovel.id, novos)
+
+        if novos:
+            imovel.status = "SUCESSO"
+            logger.success(
+                f"[{codigo_reduzido}] Atualizado com sucesso: {len(novos)} débitos "
+                f"({inseridos} novos, {alterados} alterados, {removidos} removidos)."
+            )
+        else:
+            imovel.status = "SEM_DEBITOS"
+            logger.info(f"[{codigo_reduzido}] Atualizado: Sem débitos pendentes.")
+
+    def _sincronizar_debitos(self, imovel_id, novos):
+        """
+        Upsert pela chave (imóvel, ano, parcela): insere só as parcelas novas,
+        atualiza só as que mudaram e remove as que sumiram do extrato.
+        Parcela com PDF na coluna antiga (boleto_pdf) é sempre regravada, zerando a coluna.
+        """
+        atuais = {
+            (linha.ano, linha.parcela): linha
+            for linha in self.session.execute(
+                select(
+                    DebitoIPTU.id, DebitoIPTU.ano, DebitoIPTU.parcela,
+                    *(getattr(DebitoIPTU, c) for c in CAMPOS_DEBITO),
+                    DebitoIPTU.boleto_pdf_legado.isnot(None).label("tem_legado"),
+                )
+                .where(DebitoIPTU.imovel_id == imovel_id)
+            )
+        }
+
+        inserir = [dict(debito, imovel_id=imovel_id) for chave, debito in novos.items() if chave not in atuais]
+        atualizar = [
+            dict({c: debito[c] for c in CAMPOS_DEBITO}, id=atuais[chave].id, boleto_pdf_legado=None)
+            for chave, debito in novos.items()
+            if chave in atuais and (
+                atuais[chave].tem_legado or any(getattr(atuais[chave], c) != debito[c] for c in CAMPOS_DEBITO)
+            )
+        ]
+        remover = [linha.id for chave, linha in atuais.items() if chave not in novos]
+
+        if remover:
+            self.session.execute(delete(DebitoIPTU).where(DebitoIPTU.id.in_(remover)))
+        if atualizar:
+            # UPDATE em massa pela chave primária (executemany do ORM)
+            self.session.execute(update(DebitoIPTU), atualizar)
+        if inserir:
+            self.session.execute(insert(DebitoIPTU), inserir)
+
+        return len(inserir), len(atualizar), len(remover)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from loguru import logger
+
+from src.core.persistencia import GravadorLote
+from src.core.falhas import FalhaScraper, POLITICAS_RETRY, max_tentativas_total, obter_disjuntor
+from src.metricas import metricas
+
+
+def processar_imovel(session, scraper, codigo_reduzido, gravador=None):
+    """
+    Extrai os dados de um imóvel e entrega ao gravador. Sem gravador, grava na hora
+    (lote de 1); com gravador, a escrita acontece junto com o resto do lote.
+    Retorna True/False, ou None se a parada interrompeu o imóvel antes de entregá-lo
+    (nada foi gravado: quem chamou devolve o imóvel à fila).
+    """
+    if gravador is None:
+        gravador = GravadorLote(session, tamanho_lote=1)
+
+    with metricas.cronometro("imovel"):
+        sucesso = _processar_com_retentativas(scraper, codigo_reduzido, gravador)
+    resultado = "cancelado" if sucesso is None else ("sucesso" if sucesso else "falha")
+    metricas.contar("imoveis_processados", resultado=resultado)
+    return sucesso
+
+
+def _processar_com_retentativas(scraper, codigo_reduzido, gravador):
+    disjuntor = obter_disjuntor()
+
+    try:
+        # ==============================================================================
+        # LÓGICA DE RETENTATIVA (RETRY) - POR TIPO DE FALHA, BACKOFF COM JITTER
+        # ==============================================================================
+        dados_com_bytes = None
+        tentativas_por_classe = {}
+        limite_total = max_tentativas_total()
+
+        while True:
+            # Se o portal estiver fora (disjuntor aberto), todos os workers esperam aqui
+            if not disjuntor.aguardar():
+                logger.warning(f"[{codigo_reduzido}] Desligamento solicitado durante a pausa do disjuntor.")
+                return None
+
+            try:
+                # Tenta extrair dados
+                dados_com_bytes = scraper.extrair_dados(codigo_reduzido)
+                disjuntor.registrar_sucesso()
+                # SUCESSO: Dados obtidos, sai do loop imediatamente
+                break
+            except FalhaScraper as falha:
+                disjuntor.registrar_falha(falha)
+                politica = POLITICAS_RETRY.get(falha.classe, POLITICAS_RETRY["desconhecida"])
+                tentativa = tentativas_por_classe[falha.classe] = tentativas_por_classe.get(falha.classe, 0) + 1
+
+                # FALHA: Loga e prepara para tentar de novo
+                logger.warning(
+                    f"[{codigo_reduzido}] Falha '{falha.classe}' na tentativa {tentativa}/{politica.max_tentativas}: {falha}"
+                )
+                if tentativa >= politica.max_tentativas:
+                    break
+                if sum(tentativas_por_classe.values()) >= limite_total:
+                    logger.warning(f"[{codigo_reduzido}] Limite total de {limite_total} tentativas atingido.")
+                    break
+
+                tempo_espera = politica.espera(tentativa)
+                logger.info(f"[{codigo_reduzido}] Aguardando {tempo_espera:.1f}s para tentar novamente...")
+                if disjuntor.cancelar.wait(tempo_espera):
+                    logger.warning(f"[{codigo_reduzido}] Desligamento solicitado durante a espera da retentativa.")
+                    return None
+        
+        # Se saiu do loop e a variável continua vazia, falhou todas as vezes
+        if not dados_com_bytes:
+            logger.error(f"[{codigo_reduzido}] ❌ FALHA TOTAL. Tentativas por tipo: {tentativas_por_classe}.")
+            gravador.registrar(codigo_reduzido, None)
+            return False
+        # ==============================================================================
+
+        # Fingerprint, débitos e status são gravados pelo lote (uma transação, savepoint por imóvel)
+        gravador.registrar(codigo_reduzido, dados_com_bytes)
+        return True
+
+    except Exception as e:
+        logger.exception(f"[{codigo_reduzido}] Falha Crítica no processamento.")
+        return False
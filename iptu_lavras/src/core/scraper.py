@@ -1,131 +1,467 @@
 # -*- coding: utf-8 -*-
 import os
-import time
+import re
 from playwright.sync_api import sync_playwright
+from loguru import logger
 from src.handlers.captcha import CaptchaHandler
+from src.handlers.reconhecimento import criar_reconhecedor
+from src.core.bloqueio import criar_perfil_bloqueio
+from src.core.boletos import BoletoSpool
+from src.metricas import metricas
+from src.core.falhas import (
+    FalhaScraper, FalhaCaptcha, FalhaSeletor, FalhaNavegador, FalhaHTTP, classificar_erro,
+)
+
+# Cabeçalhos que não devem ser reenviados no replay (o contexto recalcula/gerencia)
+CABECALHOS_IGNORADOS_REPLAY = {"content-length", "host", "cookie", "connection", "accept-encoding"}
+MARCADOR_CODIGO = "\x00CODIGO\x00"
+# Respostas do PUT que indicam sessão/captcha recusado pelo portal
+STATUS_NAO_AUTORIZADO = (401, 403)
+
+# Tabela de boletos: texto do botão e padrões para indexar as linhas da tela
+TEXTO_BOTAO_PDF = "Emitir 2ª Via PDF"
+# Marca posta pelo indexador no botão de cada linha (o clique vai direto nela)
+ATRIBUTO_BOLETO = "data-iptu-boleto"
+RE_DATA = re.compile(r"(\d{2})[/-](\d{2})[/-](\d{4})")
+RE_VALOR_TELA = re.compile(r"^\d{1,3}(\.\d{3})*,\d{2}$|^\d+,\d{2}$")
+RE_PARCELA = re.compile(r"^(\d{1,3})(\s*/\s*\d{1,3})?$")
 
 class IPTUScraper:
-    def __init__(self, url_alvo):
+    def __init__(self, url_alvo, max_usos_contexto=None, reconhecedor=None, transcritor=None, perfil_bloqueio=None):
         self.url = url_alvo
+        # Bloqueio de imagens/fontes/terceiros (None = usa BLOQUEIO_RECURSOS do ambiente)
+        self.perfil_bloqueio = perfil_bloqueio if perfil_bloqueio is not None else criar_perfil_bloqueio()
+        self.ultima_medicao_rede = None
+        # Transcrição do captcha: pool de processos compartilhado ou reconhecedor local
+        self.transcritor = transcritor
+        # Um reconhecedor por scraper (o modelo offline é carregado uma única vez)
+        self.reconhecedor = reconhecedor
+        if self.transcritor is None and self.reconhecedor is None:
+            self.reconhecedor = criar_reconhecedor()
         # Não criamos mais pastas físicas, pois o processamento é em memória.
-        
-    def extrair_dados(self, codigo_reduzido):
-        with sync_playwright() as p:
+
+        # Pool persistente: um único Chromium por scraper. O contexto (com a sessão de
+        # captcha resolvida) só é reciclado após falha ou, se configurado, após N páginas
+        # novas carregadas; consultas pela API e na página reaproveitada não contam.
+        if max_usos_contexto is None:
+            max_usos_contexto = int(os.getenv("MAX_USOS_CONTEXTO", "0"))
+        self.max_usos_contexto = max(0, max_usos_contexto)  # 0 = sem limite
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._usos_contexto = 0
+
+        # Modo replay: formato do PUT getExtratoIPTU capturado de uma sessão com captcha resolvido
+        self.modo_api = os.getenv("MODO_API", "true").lower() == "true"
+        self._modelo_api = None
+
+        # Downloads de boletos disparados em paralelo por imóvel
+        self.max_downloads_simultaneos = max(1, int(os.getenv("MAX_DOWNLOADS_SIMULTANEOS", "3")))
+
+        # Sessão de captcha reaproveitada: a mesma página atende vários códigos
+        self._page = None
+        self._consultas_sessao = 0
+        self.consultas_por_resolucao = []  # Quantas consultas cada captcha resolvido rendeu
+
+    # --- CICLO DE VIDA DO NAVEGADOR ---
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.fechar()
+        return False
+
+    def iniciar(self):
+        """Sobe o Playwright e o Chromium uma única vez (reaproveitado entre imóveis)."""
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        if self._browser is None or not self._browser.is_connected():
             # Configuração do Browser (Headless controlado por env)
             modo_headless = os.getenv("HEADLESS", "false").lower() == "true"
-            browser = p.chromium.launch(
-                headless=modo_headless,
-                args=["--no-sandbox", "--disable-setuid-sandbox"]
+            with metricas.cronometro("navegador_inicio"):
+                self._browser = self._playwright.chromium.launch(
+                    headless=modo_headless,
+                    args=["--no-sandbox", "--disable-setuid-sandbox"]
+                )
+
+    def fechar(self):
+        """Encerra contexto, navegador e Playwright (chamado ao sair do 'with')."""
+        self._descartar_contexto()
+        if self.consultas_por_resolucao:
+            total = sum(self.consultas_por_resolucao)
+            logger.info(
+                f"Captcha: {len(self.consultas_por_resolucao)} resoluções renderam {total} consultas "
+                f"(média {total / len(self.consultas_por_resolucao):.1f} por resolução)."
             )
-            
-            context = browser.new_context(accept_downloads=True)
-            page = context.new_page()
-            
+        try:
+            if self._browser is not None:
+                self._browser.close()
+        except Exception:
+            pass
+        self._browser = None
+        try:
+            if self._playwright is not None:
+                self._playwright.stop()
+        except Exception:
+            pass
+        self._playwright = None
+
+    def _descartar_contexto(self):
+        self._encerrar_sessao_captcha()
+        self._page = None
+        try:
+            if self._context is not None:
+                self._context.close()
+        except Exception:
+            pass
+        self._context = None
+        self._usos_contexto = 0
+        # Os cookies da sessão resolvida morrem com o contexto
+        self._modelo_api = None
+
+    def _obter_contexto(self):
+        """
+        Entrega um contexto do pool. Recicla após 'max_usos_contexto' páginas novas
+        ou se o navegador tiver caído (relança o Chromium nesse caso).
+        """
+        if self._browser is None or not self._browser.is_connected():
+            self._descartar_contexto()
+            self._browser = None
+            self.iniciar()
+
+        if self._context is not None and self.max_usos_contexto and self._usos_contexto >= self.max_usos_contexto:
+            self._descartar_contexto()
+
+        if self._context is None:
+            with metricas.cronometro("contexto_novo"):
+                self._context = self._browser.new_context(accept_downloads=True)
+            if self.perfil_bloqueio is not None:
+                self.perfil_bloqueio.instalar(self._context)
+
+        return self._context
+
+    def _reciclar_apos_falha(self):
+        """Após um crash, descarta o contexto e, se preciso, o próprio navegador."""
+        self._descartar_contexto()
+        if self._browser is not None and not self._browser.is_connected():
+            self._browser = None
+
+    # --- EXTRAÇÃO ---
+    def extrair_dados(self, codigo_reduzido):
+        """
+        Retorna o JSON do extrato (com os PDFs em 'blob_pdf', como BoletoSpool).
+        Em caso de erro levanta uma FalhaScraper tipada (captcha, timeout, seletor, HTTP...).
+        """
+        try:
+            # Compatibilidade: se usado fora do 'with', sobe o navegador sob demanda
+            if self._playwright is None:
+                self.iniciar()
+            context = self._obter_contexto()
+        except Exception as e:
+            self._reciclar_apos_falha()
+            raise FalhaNavegador(str(e)) from e
+
+        if self.perfil_bloqueio is not None:
+            self.perfil_bloqueio.zerar_medicao()
+        try:
+            with metricas.cronometro("extracao"):
+                return self._extrair_no_contexto(context, codigo_reduzido)
+        except FalhaScraper as falha:
+            metricas.contar("falhas_extracao", classe=falha.classe)
+            raise
+        finally:
+            if self.perfil_bloqueio is not None:
+                self.ultima_medicao_rede = self.perfil_bloqueio.medicao()
+                logger.debug(
+                    f"[{codigo_reduzido}] Rede: {self.ultima_medicao_rede['requisicoes_bloqueadas']} requisições evitadas, "
+                    f"{self.ultima_medicao_rede['bytes_recebidos'] / 1024:.0f} KB recebidos."
+                )
+
+    def _extrair_no_contexto(self, context, codigo_reduzido):
+        # Caminho rápido: replay direto da API, sem carregar a página
+        if self.modo_api and self._modelo_api is not None:
+            dados_json = self._consultar_via_api(context, codigo_reduzido)
+            # Com parcelas em aberto precisamos da tela para baixar os boletos
+            if dados_json is not None and not self._filtrar_debitos_abertos(dados_json):
+                return dados_json
+
+        return self._consultar_via_dom(context, codigo_reduzido)
+
+    # --- SESSÃO DE CAPTCHA ---
+    def _encerrar_sessao_captcha(self):
+        """Contabiliza quantas consultas a última resolução de captcha rendeu."""
+        if self._consultas_sessao > 0:
+            self.consultas_por_resolucao.append(self._consultas_sessao)
+            logger.debug(f"Sessão de captcha encerrada após {self._consultas_sessao} consultas.")
+        self._consultas_sessao = 0
+
+    def _fechar_pagina(self):
+        self._encerrar_sessao_captcha()
+        try:
+            if self._page is not None:
+                self._page.close()
+        except Exception:
+            pass
+        self._page = None
+
+    def _obter_pagina(self, context):
+        """Reaproveita a página já carregada (e com captcha resolvido) quando possível."""
+        if self._page is not None and not self._page.is_closed():
+            return self._page
+        self._page = context.new_page()
+        # Só carga nova de página conta para a reciclagem do contexto
+        self._usos_contexto += 1
+        with metricas.cronometro("pagina_goto"):
+            self._page.goto(self.url, timeout=60000)
+        return self._page
+
+    @staticmethod
+    def _preencher_codigo(page, codigo_reduzido):
+        # Tentativa de localizar o input por texto ou classe genérica
+        try:
+            page.locator("//div[contains(text(), 'Código Reduzido')]/following-sibling::input").first.fill(str(codigo_reduzido))
+        except:
             try:
-                # 1. Acesso e Preenchimento
-                page.goto(self.url, timeout=60000)
-                
-                # Tentativa de localizar o input por texto ou classe genérica
-                try:
-                    page.locator("//div[contains(text(), 'Código Reduzido')]/following-sibling::input").first.fill(str(codigo_reduzido))
-                except:
-                    page.locator("input.form-control").first.fill(str(codigo_reduzido))
-                
-                # 2. Resolução do Captcha
-                captcha = CaptchaHandler(page)
-                if not captcha.resolver_via_audio():
-                    return None # Falha no captcha aborta o processo
-                
+                page.locator("input.form-control").first.fill(str(codigo_reduzido))
+            except Exception as e:
+                raise FalhaSeletor(f"Campo 'Código Reduzido' não encontrado: {e}") from e
+
+    def _consultar_via_dom(self, context, codigo_reduzido):
+        try:
+            # Se o portal recusar a sessão, recarrega a página e resolve o captcha uma vez mais
+            for tentativa in range(2):
+                # 1. Acesso e Preenchimento (a página só é carregada se ainda não existir)
+                page = self._obter_pagina(context)
+                self._preencher_codigo(page, codigo_reduzido)
+
+                # 2. Resolução do Captcha (só quando o checkbox deixou de estar marcado)
+                captcha = CaptchaHandler(page, self.reconhecedor, self.transcritor)
+                if not captcha.esta_resolvido():
+                    self._encerrar_sessao_captcha()
+                    if not captcha.resolver_via_audio():
+                        self._fechar_pagina()
+                        raise FalhaCaptcha("Captcha não resolvido.") # Falha no captcha aborta o processo
+
                 # 3. Interceptação da Requisição JSON (Dados da Dívida)
                 # Aguarda o POST/PUT que retorna os dados após clicar em consultar
-                with page.expect_response(lambda r: "getExtratoIPTU" in r.url and r.request.method == "PUT", timeout=30000) as captura:
-                    btn = page.locator(".gwt-SubmitButton").first
-                    if not btn.is_visible():
-                        btn = page.locator("button").last 
-                    btn.click(force=True)
-                
+                with metricas.cronometro("extrato_put"):
+                    with page.expect_response(lambda r: "getExtratoIPTU" in r.url and r.request.method == "PUT", timeout=30000) as captura:
+                        btn = page.locator(".gwt-SubmitButton").first
+                        if not btn.is_visible():
+                            btn = page.locator("button").last
+                        btn.click(force=True)
+
                 response = captura.value
+                if response.status in STATUS_NAO_AUTORIZADO:
+                    # Sessão expirada: descarta a página (e o replay) e tenta de novo do zero
+                    self._modelo_api = None
+                    self._fechar_pagina()
+                    continue
+
                 dados_json = {}
-                
+
                 if response.status == 200:
                     dados_json = response.json()
-                    
+
                     # Se houver débitos (chave 'guia'), iniciamos o download em memória
                     if "guia" in dados_json:
-                        self._baixar_pdf_para_memoria(page, dados_json)
+                        with metricas.cronometro("pdf_downloads"):
+                            self._baixar_pdfs(page, dados_json)
 
                 elif response.status == 204:
                     # Status 204 geralmente indica "Nenhum débito encontrado"
                     dados_json = {"guia": []}
-                
+                else:
+                    raise FalhaHTTP(response.status)
+
+                self._consultas_sessao += 1
+                metricas.contar("extracoes", modo="dom")
+                if self.modo_api:
+                    self._capturar_modelo_api(response.request, codigo_reduzido)
+
                 return dados_json
-                    
-            except Exception:
-                return None
-            finally:
-                context.close()
-                browser.close()
-
-    def _baixar_pdf_para_memoria(self, page, dados_json):
+
+            raise FalhaHTTP(response.status, "Portal recusou a sessão mesmo após novo captcha.")
+
+        except FalhaScraper as falha:
+            if not isinstance(falha, (FalhaCaptcha, FalhaHTTP)):
+                self._reciclar_apos_falha()
+            raise
+        except Exception as e:
+            # Página/contexto possivelmente corrompidos: recicla antes da próxima consulta
+            self._reciclar_apos_falha()
+            raise classificar_erro(e) from e
+
+    # --- MODO REPLAY (API) ---
+    @staticmethod
+    def _substituir_codigo(texto, codigo, substituto):
+        """Troca o código apenas quando não faz parte de um número maior."""
+        if not texto:
+            return texto
+        padrao = r"(?<!\d)" + re.escape(str(codigo)) + r"(?!\d)"
+        return re.sub(padrao, lambda _: str(substituto), texto)
+
+    def _capturar_modelo_api(self, request, codigo_reduzido):
+        """Guarda URL, cabeçalhos e corpo do PUT com o código trocado por um marcador."""
+        try:
+            corpo = request.post_data or ""
+            if str(codigo_reduzido) not in corpo and str(codigo_reduzido) not in request.url:
+                return  # Sem onde injetar o próximo código: replay impossível
+
+            cabecalhos = {
+                k: v for k, v in request.all_headers().items()
+                if k.lower() not in CABECALHOS_IGNORADOS_REPLAY and not k.startswith(":")
+            }
+            self._modelo_api = {
+                "url": self._substituir_codigo(request.url, codigo_reduzido, MARCADOR_CODIGO),
+                "headers": cabecalhos,
+                "body": self._substituir_codigo(corpo, codigo_reduzido, MARCADOR_CODIGO),
+            }
+        except Exception:
+            self._modelo_api = None
+
+    def _consultar_via_api(self, context, codigo_reduzido):
         """
-        Cruza os dados do JSON com a tabela HTML, clica no botão de download,
-        lê o arquivo temporário para a memória RAM e injeta no dicionário JSON.
+        Reenvia o PUT getExtratoIPTU pelo APIRequestContext do próprio contexto
+        (mesmos cookies da sessão resolvida). Retorna None se o servidor recusar,
+        para que o chamador volte ao fluxo pela tela.
+        """
+        modelo = self._modelo_api
+        try:
+            with metricas.cronometro("extrato_api"):
+                response = context.request.fetch(
+                    modelo["url"].replace(MARCADOR_CODIGO, str(codigo_reduzido)),
+                    method="PUT",
+                    headers=modelo["headers"],
+                    data=modelo["body"].replace(MARCADOR_CODIGO, str(codigo_reduzido)),
+                    timeout=30000,
+                )
+            if response.status == 200:
+                self._consultas_sessao += 1
+                metricas.contar("extracoes", modo="api")
+                return response.json()
+            if response.status == 204:
+                self._consultas_sessao += 1
+                metricas.contar("extracoes", modo="api")
+                return {"guia": []}
+        except Exception:
+            pass
+
+        metricas.contar("replay_recusado")
+
+        # Replay recusado (sessão expirada, token do captcha vencido...): descarta o modelo
+        self._modelo_api = None
+        return None
+
+    @staticmethod
+    def _filtrar_debitos_abertos(dados_json):
+        lista_parcelas = (dados_json.get("guia") or [{}])[0].get("parcelaIPTU", [])
+        return [
+            p for p in lista_parcelas
+            if "GUIA PAGA" not in p.get("linhaDigitavel", "").upper()
+            and "NÃO RECEBER" not in p.get("linhaDigitavel", "").upper()
+        ]
+
+    # --- BOLETOS (PDF) ---
+    @staticmethod
+    def _normalizar_data(texto):
+        m = RE_DATA.search(str(texto or ""))
+        return f"{m.group(1)}/{m.group(2)}/{m.group(3)}" if m else None
+
+    @staticmethod
+    def _normalizar_valor(valor):
+        """Aceita 1234.5 (JSON) ou 'R$ 1.234,50' (tela) e devolve '1234.50'."""
+        if isinstance(valor, (int, float)):
+            return f"{float(valor):.2f}"
+        texto = str(valor or "").replace("R$", "").strip()
+        if not RE_VALOR_TELA.match(texto):
+            return None
+        return f"{float(texto.replace('.', '').replace(',', '.')):.2f}"
+
+    @staticmethod
+    def _normalizar_parcela(valor):
+        m = RE_PARCELA.match(str(valor if valor is not None else "").strip())
+        return int(m.group(1)) if m else None
+
+    def _indexar_linhas_boleto(self, page):
+        """
+        Lê a tabela inteira numa única chamada ao navegador e indexa cada linha
+        com botão de PDF pela chave exata (vencimento, valor, parcela).
+        Só entram as linhas "folha" (o GWT aninha tabelas: a linha de layout externa
+        também contém o botão), e o botão de cada uma é marcado com ATRIBUTO_BOLETO
+        = posição: o clique usa a mesma linha que foi indexada.
+        """
+        linhas = page.evaluate(
+            """([texto, atributo]) => {
+                document.querySelectorAll(`[${atributo}]`).forEach(el => el.removeAttribute(atributo));
+                const botao = tr => Array.from(tr.querySelectorAll('a')).find(a => a.textContent.includes(texto));
+                return Array.from(document.querySelectorAll('tr'))
+                    .filter(tr => botao(tr) && !Array.from(tr.querySelectorAll('tr')).some(botao))
+                    .map((tr, posicao) => {
+                        botao(tr).setAttribute(atributo, String(posicao));
+                        return Array.from(tr.querySelectorAll('td')).map(td => td.innerText.trim());
+                    });
+            }""",
+            [TEXTO_BOTAO_PDF, ATRIBUTO_BOLETO],
+        )
+
+        indice = {}
+        for posicao, celulas in enumerate(linhas):
+            datas = {d for d in map(self._normalizar_data, celulas) if d}
+            valores = {v for v in map(self._normalizar_valor, celulas) if v}
+            parcelas = {p for p in map(self._normalizar_parcela, celulas) if p is not None} or {None}
+            for data in datas:
+                for valor in valores:
+                    for parcela in parcelas:
+                        indice.setdefault((data, valor, parcela), posicao)
+        return indice
+
+    def _baixar_pdfs(self, page, dados_json):
+        """
+        Cruza os dados do JSON com a tabela HTML (indexada uma única vez), dispara
+        os downloads em lotes de 'max_downloads_simultaneos' e injeta cada PDF
+        no dicionário JSON como um BoletoSpool (memória limitada, transborda para disco).
         """
         try:
             # Filtra apenas parcelas em aberto para evitar processamento inútil
-            lista_parcelas = dados_json.get("guia", [{}])[0].get("parcelaIPTU", [])
-            debitos_abertos = [
-                p for p in lista_parcelas 
-                if "GUIA PAGA" not in p.get("linhaDigitavel", "").upper() 
-                and "NÃO RECEBER" not in p.get("linhaDigitavel", "").upper()
-            ]
-            
+            debitos_abertos = self._filtrar_debitos_abertos(dados_json)
+
             if not debitos_abertos:
                 return
 
-            # Localiza todas as linhas da tabela que possuem botão de download
-            linhas_com_botao = page.locator("tr:has(a:has-text('Emitir 2ª Via PDF'))").all()
+            indice = self._indexar_linhas_boleto(page)
 
+            # Casamento exato JSON x tela: (vencimento, valor, parcela)
+            pendentes = []
             for debito in debitos_abertos:
-                # Prepara dados para o "Match" (Encontro) entre JSON e HTML
-                vencimento_json = debito.get("vencimento")
-                valor_json = str(debito.get("totalParcela")).replace(".", ",")
-                vencimento_tela = vencimento_json.replace("-", "/") # Ajuste de formato de data
-
-                # Itera sobre as linhas visuais para encontrar a correspondente
-                for linha in linhas_com_botao:
-                    texto_linha = linha.inner_text()
-                    
-                    # Verifica se a linha contém a data ou o valor do débito atual
-                    match_vencimento = (vencimento_tela in texto_linha or vencimento_json in texto_linha)
-                    match_valor = (valor_json in texto_linha)
-
-                    if match_vencimento or match_valor:
-                        botao = linha.locator("a:has-text('Emitir 2ª Via PDF')").first
-                        botao.scroll_into_view_if_needed()
-                        
-                        try:
-                            # Gerencia o evento de download
-                            with page.expect_download(timeout=60000) as download_info:
-                                botao.click(force=True)
-                            
-                            download = download_info.value
-                            path_temp = download.path()
-                            
-                            # Lê os bytes do arquivo temporário para a memória
-                            with open(path_temp, "rb") as f:
-                                bytes_pdf = f.read()
-                            
-                            # Injeta os bytes direto no objeto JSON original
-                            debito['blob_pdf'] = bytes_pdf
-                            
-                            # Pequena pausa para evitar sobrecarga ou bloqueio do servidor
-                            time.sleep(2)
-                            break 
-                            
-                        except Exception:
-                            # Se falhar um download, continua para o próximo débito
-                            continue
+                data = self._normalizar_data(debito.get("vencimento"))
+                valor = self._normalizar_valor(debito.get("totalParcela"))
+                parcela = self._normalizar_parcela(debito.get("numero"))
+                posicao = indice.get((data, valor, parcela), indice.get((data, valor, None)))
+                if posicao is not None:
+                    pendentes.append((debito, posicao))
+
+            # Concorrência limitada: dispara um lote de downloads e só então lê os arquivos,
+            # assim as transferências do lote correm em paralelo no navegador.
+            for inicio in range(0, len(pendentes), self.max_downloads_simultaneos):
+                lote = []
+                for debito, posicao in pendentes[inicio:inicio + self.max_downloads_simultaneos]:
+                    try:
+                        botao = page.locator(f'[{ATRIBUTO_BOLETO}="{posicao}"]').first
+                        with page.expect_download(timeout=60000) as download_info:
+                            botao.click(force=True)
+                        lote.append((debito, download_info.value))
+                    except Exception:
+                        # Se falhar um download, continua para o próximo débito
+                        continue
+
+                for debito, download in lote:
+                    try:
+                        # Copia o arquivo temporário em partes para um spool limitado (memória/disco)
+                        debito['blob_pdf'] = BoletoSpool.de_arquivo(download.path())
+                    except Exception:
+                        continue
 
         except Exception:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import os
+import signal
+import threading
+import time
+from loguru import logger
+
+from src.core.scraper import IPTUScraper
+from src.core.persistencia import GravadorLote
+from src.handlers.transcricao import criar_servico_transcricao
+from src.core.falhas import obter_disjuntor
+
+
+class PoolWorkers:
+    """
+    Processa a fila de imóveis com N workers em paralelo.
+    Cada worker é uma thread com seu próprio IPTUScraper (navegador/contexto)
+    e sua própria sessão de banco, pois nenhum dos dois é thread-safe.
+    Os imóveis são reivindicados da fila em pequenos lotes (ver src/core/fila.py).
+    """
+
+    def __init__(self, db, url_alvo, n_workers, processar, tamanho_claim=None):
+        self.db = db
+        self.url = url_alvo
+        self.n_workers = max(1, n_workers)
+        # Função que processa um imóvel: processar(session, scraper, codigo_reduzido, gravador) -> bool
+        # (None = interrompido pela parada sem gravar nada)
+        self.processar = processar
+        if tamanho_claim is None:
+            tamanho_claim = int(os.getenv("TAMANHO_CLAIM", "5"))
+        self.tamanho_claim = max(1, tamanho_claim)
+        self.parar = threading.Event()
+        self._encerrado = threading.Event()  # Workers terminaram (fim da fila ou parada)
+        self.estatisticas = {}
+        self._fila = None
+        self._transcritor = None
+
+    def _instalar_sinais(self):
+        """SIGINT/SIGTERM: termina o imóvel atual e encerra os workers com segurança."""
+        def _encerrar(signum, frame):
+            if not self.parar.is_set():
+                logger.warning("Sinal de parada recebido. Finalizando imóveis em andamento...")
+            self.parar.set()
+            # Libera quem estiver parado na pausa do disjuntor ou num backoff
+            obter_disjuntor().cancelar.set()
+
+        # Sinais só podem ser registrados pela thread principal
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, _encerrar)
+            signal.signal(signal.SIGTERM, _encerrar)
+
+    def _worker(self, nome):
+        stats = {"processados": 0, "sucesso": 0, "falha": 0, "tempo_total": 0.0}
+        self.estatisticas[nome] = stats
+        session = self.db.get_session()
+        gravador = GravadorLote(session, execucao_id=self._fila.execucao_id)
+
+        try:
+            with IPTUScraper(self.url, transcritor=self._transcritor) as scraper:
+                while not self.parar.is_set():
+                    lote = self._fila.proximos(session, self.tamanho_claim)
+                    if not lote:
+                        break
+
+                    for posicao, codigo in enumerate(lote):
+                        if self.parar.is_set():
+                            # Devolve à fila o que foi reivindicado e não será processado
+                            self._fila.liberar(session, lote[posicao:])
+                            break
+
+                        inicio = time.monotonic()
+                        ok = self.processar(session, scraper, codigo, gravador)
+                        if ok is None:
+                            # Parada no meio do imóvel: ele e o resto do lote voltam à fila
+                            self._fila.liberar(session, lote[posicao:])
+                            break
+
+                        stats["processados"] += 1
+                        stats["tempo_total"] += time.monotonic() - inicio
+                        stats["sucesso" if ok else "falha"] += 1
+        except Exception:
+            logger.exception(f"[{nome}] Worker abortado.")
+        finally:
+            # Grava o que sobrou do lote antes de encerrar (inclusive em parada por sinal)
+            gravador.flush()
+            session.close()
+            logger.info(
+                f"[{nome}] Encerrado: {stats['processados']} imóveis "
+                f"({stats['sucesso']} ok / {stats['falha']} falhas) em {stats['tempo_total']:.0f}s."
+            )
+
+    def _renovar_leases(self):
+        """Mantém vivos os leases do processo enquanto houver worker rodando."""
+        intervalo = self._fila.intervalo_renovacao
+        if not intervalo:
+            return
+        session = self.db.get_session()
+        try:
+            while not self._encerrado.wait(intervalo):
+                self._fila.renovar(session)
+        finally:
+            session.close()
+
+    def executar(self, fila):
+        """
+        'fila' expõe proximos(session, quantidade), liberar(session, codigos),
+        renovar(session), intervalo_renovacao e execucao_id.
+        """
+        self._fila = fila
+
+        self._instalar_sinais()
+        # Transcrição do captcha num pool de processos compartilhado por todos os workers
+        self._transcritor = criar_servico_transcricao(self.n_workers)
+        logger.info(
+            f"Iniciando {self.n_workers} workers"
+            + (f" com {self._transcritor.processos} processos de transcrição." if self._transcritor else ".")
+        )
+
+        threads = [
+            threading.Thread(target=self._worker, args=(f"worker-{i + 1}",), daemon=True)
+            for i in range(self.n_workers)
+        ]
+        for t in threads:
+            t.start()
+        threading.Thread(target=self._renovar_leases, name="renovador-leases", daemon=True).start()
+
+        # join com timeout para o Ctrl+C continuar chegando à thread principal
+        try:
+            while any(t.is_alive() for t in threads):
+                for t in threads:
+                    t.join(timeout=0.5)
+        finally:
+            self._encerrado.set()
+            if self._transcritor is not None:
+                self._transcritor.encerrar()
+
+        return self.estatisticas
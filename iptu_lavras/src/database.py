@@ -1,21 +1,37 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, LargeBinary
+import zlib
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, LargeBinary, JSON, Index, UniqueConstraint, func, select
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.orm import declarative_base, relationship, deferred
 from datetime import datetime
 
 Base = declarative_base()
 
+# Leitura de boletos em partes (bytes comprimidos por ida ao banco)
+TAMANHO_PARTE_BOLETO = 256 * 1024
+
 class Imovel(Base):
     __tablename__ = 'imoveis'
     id = Column(Integer, primary_key=True)
     codigo_reduzido = Column(String(50), unique=True, nullable=False)
-    status = Column(String(50), default="PENDENTE") 
-    data_atualizacao = Column(DateTime, default=datetime.now, onupdate=datetime.now)
-    dados_brutos = Column(JSONB, nullable=True) 
+    status = Column(String(50), default="PENDENTE", index=True)
+    data_atualizacao = Column(DateTime, default=datetime.now, onupdate=datetime.now, index=True)
+    # Carregado só sob demanda: a comparação de mudança usa o hash_conteudo
+    # JSONB no PostgreSQL; JSON genérico em outros bancos (ex: SQLite do benchmark)
+    dados_brutos = deferred(Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True))
+    hash_conteudo = Column(String(64), nullable=True)  # SHA-256 do payload sem os PDFs
+    # Lease da fila distribuída: quem está processando o imóvel e até quando
+    lease_ate = Column(DateTime, nullable=True)
+    lease_dono = Column(String(100), nullable=True)
     debitos = relationship("DebitoIPTU", back_populates="imovel", cascade="all, delete-orphan")
 
 class DebitoIPTU(Base):
     __tablename__ = 'debitos_iptu'
+    __table_args__ = (
+        # Chave natural da parcela: o gravador faz upsert por ela (só grava o que mudou)
+        UniqueConstraint('imovel_id', 'ano', 'parcela', name='uq_debitos_iptu_imovel_ano_parcela'),
+        # Agendador (débito aberto vencendo) e relatórios por situação
+        Index('ix_debitos_iptu_imovel_situacao_vencimento', 'imovel_id', 'situacao', 'vencimento'),
+    )
     
     id = Column(Integer, primary_key=True)
     imovel_id = Column(Integer, ForeignKey('imoveis.id'))
@@ -24,25 +40,147 @@ class DebitoIPTU(Base):
     parcela = Column(Integer)
     valor = Column(Float)
     
-    # Novas colunas de data
-    vencimento = Column(String(20))          
-    vencimento_original = Column(String(20)) 
+    # Datas nativas (antes texto 'YYYY-MM-DD'; convertidas pela migração)
+    vencimento = Column(Date)
+    vencimento_original = Column(Date)
     
     situacao = Column(String(50)) # "Aberto", "Quitado", "Cancelado"
-    boleto_pdf = Column(LargeBinary, nullable=True) # Será NULL se estiver quitado
+    # Referência ao PDF no armazenamento por conteúdo. Será NULL se estiver quitado
+    # (indexada: a limpeza de órfãos e a checagem da FK ao apagar um PDF buscam por ela)
+    boleto_sha256 = Column(String(64), ForeignKey('boletos_pdf.sha256'), nullable=True, index=True)
+    # Coluna antiga com o PDF cru: só lida para registros gravados antes do 'boletos_pdf'.
+    # O gravador a zera quando regrava a parcela (o PDF passa a morar no 'boletos_pdf')
+    boleto_pdf_legado = deferred(Column("boleto_pdf", LargeBinary, nullable=True))
     
     imovel = relationship("Imovel", back_populates="debitos")
+    boleto = relationship("BoletoPDF")
+
+    @property
+    def boleto_pdf(self):
+        """Bytes do PDF (descomprimidos), carregados só quando acessados."""
+        if self.boleto is not None:
+            return self.boleto.ler()
+        return self.boleto_pdf_legado
+
+class BoletoPDF(Base):
+    """PDFs deduplicados pelo SHA-256 do conteúdo e guardados comprimidos (zlib)."""
+    __tablename__ = 'boletos_pdf'
+
+    sha256 = Column(String(64), primary_key=True)
+    tamanho = Column(Integer, nullable=False)  # Tamanho original, antes da compressão
+    conteudo = deferred(Column(LargeBinary, nullable=False))
+    criado_em = Column(DateTime, default=datetime.now)
+
+    def ler(self):
+        return zlib.decompress(self.conteudo)
+
+    @staticmethod
+    def abrir(session, sha256, tamanho_parte=TAMANHO_PARTE_BOLETO):
+        """
+        Gera o PDF descomprimido em partes, buscando o conteúdo comprimido
+        fatiado no banco (substr), sem carregar o blob inteiro na memória.
+        """
+        descompressor = zlib.decompressobj()
+        inicio = 1
+        while True:
+            parte = session.execute(
+                select(func.substr(BoletoPDF.conteudo, inicio, tamanho_parte))
+                .where(BoletoPDF.sha256 == sha256)
+            ).scalar()
+            if not parte:
+                break
+            yield descompressor.decompress(bytes(parte))
+            if len(parte) < tamanho_parte:
+                break
+            inicio += tamanho_parte
+        resto = descompressor.flush()
+        if resto:
+            yield resto
+
+class Execucao(Base):
+    """Um ciclo de processamento da fila. Sobrevive a quedas: a próxima invocação retoma o ciclo aberto."""
+    __tablename__ = 'execucoes'
+
+    id = Column(Integer, primary_key=True)
+    modo = Column(String(20), nullable=False)  # "agendado" ou "todos"
+    status = Column(String(20), default="EM_ANDAMENTO")  # EM_ANDAMENTO / CONCLUIDA / ABANDONADA
+    iniciada_em = Column(DateTime, default=datetime.now)
+    finalizada_em = Column(DateTime, nullable=True)
+    # Soma do tempo das invocações (a vazão não conta o tempo em que o robô ficou parado)
+    segundos_ativos = Column(Float, default=0.0)
+    invocacoes = Column(Integer, default=0)
+
+class ProgressoExecucao(Base):
+    """Imóveis já tratados no ciclo (gravado na mesma transação dos dados do imóvel)."""
+    __tablename__ = 'execucoes_imoveis'
+
+    execucao_id = Column(Integer, ForeignKey('execucoes.id', ondelete="CASCADE"), primary_key=True)
+    imovel_id = Column(Integer, ForeignKey('imoveis.id', ondelete="CASCADE"), primary_key=True)
+    status = Column(String(50))
+    concluido_em = Column(DateTime, default=datetime.now)
+
+# Alterações de schema em tabelas já existentes (o create_all não adiciona colunas)
+MIGRACOES = [
+    "ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS hash_conteudo VARCHAR(64)",
+    "ALTER TABLE debitos_iptu ADD COLUMN IF NOT EXISTS boleto_sha256 VARCHAR(64) REFERENCES boletos_pdf (sha256)",
+    "ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS lease_ate TIMESTAMP",
+    "ALTER TABLE imoveis ADD COLUMN IF NOT EXISTS lease_dono VARCHAR(100)",
+    # Vencimentos de texto para DATE (só se ainda forem texto; valores fora do padrão viram NULL)
+    r"""
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'debitos_iptu' AND column_name = 'vencimento') <> 'date' THEN
+            ALTER TABLE debitos_iptu
+                ALTER COLUMN vencimento TYPE DATE USING (
+                    CASE WHEN vencimento ~ '^\d{4}-\d{2}-\d{2}$' THEN vencimento::date
+                         WHEN vencimento ~ '^\d{2}-\d{2}-\d{4}$' THEN to_date(vencimento, 'DD-MM-YYYY')
+                    END),
+                ALTER COLUMN vencimento_original TYPE DATE USING (
+                    CASE WHEN vencimento_original ~ '^\d{4}-\d{2}-\d{2}$' THEN vencimento_original::date
+                         WHEN vencimento_original ~ '^\d{2}-\d{2}-\d{4}$' THEN to_date(vencimento_original, 'DD-MM-YYYY')
+                    END);
+        END IF;
+    END $$
+    """,
+    # Chave natural da parcela: remove duplicatas antigas (fica a mais recente) antes da constraint
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_debitos_iptu_imovel_ano_parcela') THEN
+            DELETE FROM debitos_iptu a USING debitos_iptu b
+            WHERE a.imovel_id = b.imovel_id AND a.ano = b.ano AND a.parcela = b.parcela AND a.id < b.id;
+            ALTER TABLE debitos_iptu
+                ADD CONSTRAINT uq_debitos_iptu_imovel_ano_parcela UNIQUE (imovel_id, ano, parcela);
+        END IF;
+    END $$
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_debitos_iptu_imovel_situacao_vencimento ON debitos_iptu (imovel_id, situacao, vencimento)",
+    "CREATE INDEX IF NOT EXISTS ix_imoveis_status ON imoveis (status)",
+    "CREATE INDEX IF NOT EXISTS ix_imoveis_data_atualizacao ON imoveis (data_atualizacao)",
+    "CREATE INDEX IF NOT EXISTS ix_debitos_iptu_boleto_sha256 ON debitos_iptu (boleto_sha256)",
+]
 
 class DatabaseHandler:
     # ... (O restante da classe permanece igual) ...
-    def __init__(self, connection_string):
+    def __init__(self, connection_string, **engine_kwargs):
         from sqlalchemy import create_engine
         from sqlalchemy.orm import sessionmaker
-        self.engine = create_engine(connection_string, echo=False)
+        self.engine = create_engine(connection_string, echo=False, **engine_kwargs)
         self.Session = sessionmaker(bind=self.engine)
     
     def init_db(self):
         Base.metadata.create_all(self.engine)
+        self._aplicar_migracoes()
+
+    def _aplicar_migracoes(self):
+        # As migrações usam sintaxe do PostgreSQL (IF NOT EXISTS)
+        if self.engine.dialect.name != "postgresql":
+            return
+        from sqlalchemy import text
+        with self.engine.begin() as conn:
+            for comando in MIGRACOES:
+                conn.execute(text(comando))
 
     def get_session(self):
         return self.Session()
\ No newline at end of file
@@ -1,21 +1,44 @@
-import os
-import time
-import requests
-import speech_recognition as sr
-from pydub import AudioSegment
+from src.handlers.reconhecimento import converter_mp3_para_wav, criar_reconhecedor
+from src.metricas import metricas
 
 class CaptchaHandler:
-    def __init__(self, page):
+    def __init__(self, page, reconhecedor=None, transcritor=None):
         self.page = page
-        self.audio_mp3 = "temp_captcha.mp3"
-        self.audio_wav = "temp_captcha.wav"
+        # Pool de processos compartilhado (ServicoTranscricao); sem ele, transcreve na própria thread
+        self.transcritor = transcritor
+        # Motor de transcrição plugável (Google, Vosk offline, falso para testes)
+        self.reconhecedor = reconhecedor
+        if self.transcritor is None and self.reconhecedor is None:
+            self.reconhecedor = criar_reconhecedor()
 
-    def _cleanup(self):
-        """Remove arquivos temporários de áudio."""
-        if os.path.exists(self.audio_mp3): os.remove(self.audio_mp3)
-        if os.path.exists(self.audio_wav): os.remove(self.audio_wav)
+    def _transcrever_audio(self, src):
+        """Download, conversão e transcrição em memória: nada é gravado em disco."""
+        import requests
+        with metricas.cronometro("captcha_audio_download"):
+            mp3_bytes = requests.get(src, timeout=30).content
+        with metricas.cronometro("captcha_transcricao"):
+            if self.transcritor is not None:
+                return self.transcritor.transcrever(mp3_bytes)
+            wav_bytes = converter_mp3_para_wav(mp3_bytes)
+            return self.reconhecedor.transcrever(wav_bytes)
+
+    def esta_resolvido(self, timeout=2000):
+        """Retorna True se o checkbox do reCAPTCHA ainda está marcado (sessão válida)."""
+        try:
+            frame = self.page.frame_locator("iframe[src*='recaptcha/api2/anchor']")
+            anchor = frame.locator("#recaptcha-anchor")
+            return anchor.get_attribute("aria-checked", timeout=timeout) == "true"
+        except Exception:
+            return False
 
     def resolver_via_audio(self):
+        """Resolve o captcha (registra duração e taxa de sucesso nas métricas)."""
+        with metricas.cronometro("captcha"):
+            resolvido = self._resolver_via_audio()
+        metricas.contar("captcha", resultado="sucesso" if resolvido else "falha")
+        return resolvido
+
+    def _resolver_via_audio(self):
         try:
             frame = self.page.frame_locator("iframe[src*='recaptcha/api2/anchor']")
             anchor = frame.locator("#recaptcha-anchor")
@@ -40,37 +63,25 @@ class CaptchaHandler:
             
             if btn_audio.is_visible():
                 btn_audio.click()
-                time.sleep(1.5) # Aguarda transição da interface
+                self.page.wait_for_timeout(1500) # Aguarda transição da interface (sem travar o roteamento)
                 
                 # Obtém URL do áudio
                 src = bframe.locator("#audio-source").get_attribute("src")
                 if not src: 
                     return False
                 
-                # Download do arquivo MP3
-                with open(self.audio_mp3, "wb") as f:
-                    f.write(requests.get(src).content)
-                
-                # Conversão MP3 -> WAV (Necessário para a lib SpeechRecognition)
-                AudioSegment.from_mp3(self.audio_mp3).export(self.audio_wav, format="wav")
-                
-                # Transcrição usando Google Speech API
-                rec = sr.Recognizer()
-                with sr.AudioFile(self.audio_wav) as source:
-                    audio_data = rec.record(source)
-                    texto = rec.recognize_google(audio_data, language="en-US")
+                # Download + conversão MP3 -> WAV + transcrição (tudo em memória)
+                texto = self._transcrever_audio(src)
                 
                 # Preenche e submete
                 bframe.locator("#audio-response").fill(texto)
                 bframe.locator("#recaptcha-verify-button").click()
                 
-                time.sleep(2) # Aguarda validação do Google
+                self.page.wait_for_timeout(2000) # Aguarda validação do Google (o XHR segue durante a espera)
                 
-                self._cleanup()
                 return anchor.get_attribute("aria-checked") == "true"
             
             return False
             
         except Exception:
-            self._cleanup()
             return False
\ No newline at end of file
@@ -0,0 +1,94 @@
+import io
+import json
+import os
+
+# Formato entregue aos reconhecedores: WAV PCM 16 kHz mono (aceito por Google e Vosk)
+TAXA_AMOSTRAGEM = 16000
+
+
+def converter_mp3_para_wav(mp3_bytes):
+    """Conversão MP3 -> WAV inteiramente em memória (sem arquivos temporários)."""
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(io.BytesIO(mp3_bytes), format="mp3")
+    audio = audio.set_frame_rate(TAXA_AMOSTRAGEM).set_channels(1).set_sample_width(2)
+    saida = io.BytesIO()
+    audio.export(saida, format="wav")
+    return saida.getvalue()
+
+
+class Reconhecedor:
+    """Interface dos motores de transcrição: recebe WAV em bytes e devolve o texto."""
+    nome = "base"
+
+    def transcrever(self, wav_bytes):
+        raise NotImplementedError
+
+
+class ReconhecedorGoogle(Reconhecedor):
+    """Google Speech API (online), via SpeechRecognition — comportamento original."""
+    nome = "google"
+
+    def __init__(self, idioma="en-US"):
+        self.idioma = idioma
+
+    def transcrever(self, wav_bytes):
+        import speech_recognition as sr
+        rec = sr.Recognizer()
+        with sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+            audio_data = rec.record(source)
+        return rec.recognize_google(audio_data, language=self.idioma)
+
+
+class ReconhecedorVosk(Reconhecedor):
+    """Motor offline (Vosk). Dependência opcional: pip install vosk + modelo em VOSK_MODELO."""
+    nome = "vosk"
+
+    def __init__(self, caminho_modelo=None):
+        try:
+            from vosk import Model
+        except ImportError as e:
+            raise RuntimeError("RECONHECEDOR_AUDIO=vosk exige o pacote 'vosk' instalado.") from e
+        caminho_modelo = caminho_modelo or os.getenv("VOSK_MODELO", "modelos/vosk-model-small-en-us")
+        # O modelo é pesado: carregado uma vez e reaproveitado em todas as transcrições
+        self._modelo = Model(caminho_modelo)
+
+    def transcrever(self, wav_bytes):
+        import wave
+        from vosk import KaldiRecognizer
+
+        with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+            rec = KaldiRecognizer(self._modelo, wav.getframerate())
+            while True:
+                bloco = wav.readframes(4000)
+                if not bloco:
+                    break
+                rec.AcceptWaveform(bloco)
+        return json.loads(rec.FinalResult()).get("text", "")
+
+
+class ReconhecedorFalso(Reconhecedor):
+    """Para testes/benchmark: devolve um texto fixo e guarda os áudios recebidos."""
+    nome = "falso"
+
+    def __init__(self, resposta="teste"):
+        self.resposta = resposta
+        self.chamadas = []
+
+    def transcrever(self, wav_bytes):
+        self.chamadas.append(len(wav_bytes))
+        return self.resposta
+
+
+RECONHECEDORES = {
+    ReconhecedorGoogle.nome: ReconhecedorGoogle,
+    ReconhecedorVosk.nome: ReconhecedorVosk,
+    ReconhecedorFalso.nome: ReconhecedorFalso,
+}
+
+
+def criar_reconhecedor(nome=None):
+    """Instancia o motor escolhido em RECONHECEDOR_AUDIO (padrão: google)."""
+    nome = (nome or os.getenv("RECONHECEDOR_AUDIO", "google")).lower()
+    if nome not in RECONHECEDORES:
+        raise ValueError(f"Reconhecedor de áudio desconhecido: {nome}")
+    return RECONHECEDORES[nome]()
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeout
+
+from src.handlers.reconhecimento import converter_mp3_para_wav, criar_reconhecedor
+
+# Cada processo do pool carrega o seu reconhecedor uma única vez (ver _inicializar_processo)
+_reconhecedor_processo = None
+
+
+def _inicializar_processo(nome_reconhecedor):
+    global _reconhecedor_processo
+    _reconhecedor_processo = criar_reconhecedor(nome_reconhecedor)
+
+
+def _transcrever_no_processo(mp3_bytes):
+    """Executa no processo filho: decodificação + reconhecimento (trabalho de CPU)."""
+    wav_bytes = converter_mp3_para_wav(mp3_bytes)
+    return _reconhecedor_processo.transcrever(wav_bytes)
+
+
+class ServicoTranscricao:
+    """
+    Pool de processos compartilhado pelos workers de navegador. O worker entrega
+    o MP3 do captcha e aguarda o texto; a CPU pesada roda fora das threads do
+    Playwright. A fila é limitada ('max_pendentes') e toda espera tem timeout.
+    """
+
+    def __init__(self, processos=None, max_pendentes=None, timeout=None, nome_reconhecedor=None):
+        self.processos = max(1, processos or os.cpu_count() or 1)
+        if max_pendentes is None:
+            max_pendentes = int(os.getenv("MAX_TRANSCRICOES_PENDENTES", str(self.processos * 2)))
+        if timeout is None:
+            timeout = float(os.getenv("TIMEOUT_TRANSCRICAO", "60"))
+        self.timeout = timeout
+        self._vagas = threading.BoundedSemaphore(max(1, max_pendentes))
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processos,
+            initializer=_inicializar_processo,
+            initargs=(nome_reconhecedor or os.getenv("RECONHECEDOR_AUDIO", "google"),),
+            # Os processos nascem sob demanda a partir das threads do Playwright: fork copiaria
+            # locks e threads do pai num estado inconsistente
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.encerrar()
+        return False
+
+    def transcrever(self, mp3_bytes, timeout=None):
+        """Bloqueia o worker chamador até o texto ficar pronto (ou estourar o timeout)."""
+        timeout = self.timeout if timeout is None else timeout
+        # Um prazo só para a espera pela vaga e pelo resultado
+        prazo = time.monotonic() + timeout
+        if not self._vagas.acquire(timeout=timeout):
+            raise TimeoutError("Fila de transcrição cheia.")
+        try:
+            futuro = self._executor.submit(_transcrever_no_processo, mp3_bytes)
+        except Exception:
+            self._vagas.release()
+            raise
+        # A vaga só volta quando o trabalho termina de fato: cancel() não interrompe um
+        # trabalho já em execução, e liberar antes deixaria os atrasados se acumularem no pool
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=max(0.0, prazo - time.monotonic()))
+        except FuturoTimeout:
+            futuro.cancel()
+            raise TimeoutError("Transcrição do captcha excedeu o tempo limite.")
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def criar_servico_transcricao(n_workers):
+    """
+    PROCESSOS_TRANSCRICAO: 0 = transcrição na própria thread do worker.
+    Sem a variável, usa o pool só quando há mais de um worker de navegador.
+    """
+    valor = os.getenv("PROCESSOS_TRANSCRICAO")
+    if valor is None:
+        processos = min(n_workers, os.cpu_count() or 1) if n_workers > 1 else 0
+    else:
+        processos = int(valor)
+    return ServicoTranscricao(processos=processos) if processos > 0 else None
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas por etapa do robô (navegador, página, captcha, PUT, PDFs, banco).
+Registro único do processo, exportado em formato Prometheus (endpoint HTTP
+ou textfile do node_exporter) e como resumo JSON por execução.
+"""
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIXO = "iptu"
+# Limites dos buckets (segundos): de operações de DB a downloads/captchas longos
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Amostras guardadas por etapa para p50/p95 do resumo (memória limitada)
+MAX_AMOSTRAS = 5000
+
+
+class Histograma:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.soma = 0.0
+        self.contagem = 0
+        self.amostras = []
+
+    def observar(self, segundos):
+        self.soma += segundos
+        self.contagem += 1
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                self.buckets[i] += 1
+        if len(self.amostras) < MAX_AMOSTRAS:
+            self.amostras.append(segundos)
+        else:
+            # Substituição circular: mantém amostras recentes sem crescer
+            self.amostras[self.contagem % MAX_AMOSTRAS] = segundos
+
+    def percentil(self, p):
+        if not self.amostras:
+            return 0.0
+        ordenadas = sorted(self.amostras)
+        return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self.inicio = time.time()
+
+    # --- COLETA ---
+    def observar(self, etapa, segundos):
+        with self._lock:
+            self._histogramas.setdefault(etapa, Histograma()).observar(segundos)
+
+    @contextmanager
+    def cronometro(self, etapa):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(etapa, time.perf_counter() - inicio)
+
+    def contar(self, nome, quantidade=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + quantidade
+
+    def contador(self, nome, **rotulos):
+        with self._lock:
+            return self._contadores.get((nome, tuple(sorted(rotulos.items()))), 0)
+
+    # --- EXPORTAÇÃO ---
+    def texto_prometheus(self):
+        linhas = []
+        with self._lock:
+            if self._histogramas:
+                nome = f"{PREFIXO}_etapa_segundos"
+                linhas.append(f"# HELP {nome} Duração de cada etapa do robô.")
+                linhas.append(f"# TYPE {nome} histogram")
+                for etapa, h in sorted(self._histogramas.items()):
+                    for limite, quantidade in zip(BUCKETS, h.buckets):
+                        linhas.append(f'{nome}_bucket{{etapa="{etapa}",le="{limite}"}} {quantidade}')
+                    linhas.append(f'{nome}_bucket{{etapa="{etapa}",le="+Inf"}} {h.contagem}')
+                    linhas.append(f'{nome}_sum{{etapa="{etapa}"}} {h.soma:.6f}')
+                    linhas.append(f'{nome}_count{{etapa="{etapa}"}} {h.contagem}')
+
+            for nome in sorted({n for n, _ in self._contadores}):
+                linhas.append(f"# TYPE {PREFIXO}_{nome}_total counter")
+                for (n, rotulos), valor in sorted(self._contadores.items()):
+                    if n != nome:
+                        continue
+                    texto_rotulos = ",".join(f'{k}="{v}"' for k, v in rotulos)
+                    linhas.append(f"{PREFIXO}_{nome}_total{{{texto_rotulos}}} {valor}")
+        return "\n".join(linhas) + "\n"
+
+    def gravar_textfile(self, caminho):
+        """Escrita atômica (node_exporter lê o arquivo a qualquer momento)."""
+        temporario = f"{caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(self.texto_prometheus())
+        os.replace(temporario, caminho)
+
+    def taxa_sucesso_captcha(self):
+        sucesso = self.contador("captcha", resultado="sucesso")
+        falha = self.contador("captcha", resultado="falha")
+        return round(sucesso / (sucesso + falha), 4) if (sucesso + falha) else None
+
+    def resumo(self):
+        with self._lock:
+            etapas = {
+                etapa: {
+                    "n": h.contagem,
+                    "total_s": round(h.soma, 3),
+                    "media_ms": round(h.soma / h.contagem * 1000, 1) if h.contagem else 0.0,
+                    "p50_ms": round(h.percentil(50) * 1000, 1),
+                    "p95_ms": round(h.percentil(95) * 1000, 1),
+                }
+                for etapa, h in sorted(self._histogramas.items())
+            }
+            contadores = {
+                n + "".join(f"[{k}={v}]" for k, v in rotulos): valor
+                for (n, rotulos), valor in sorted(self._contadores.items())
+            }
+        return {
+            "duracao_s": round(time.time() - self.inicio, 1),
+            "etapas": etapas,
+            "contadores": contadores,
+            "captcha_taxa_sucesso": self.taxa_sucesso_captcha(),
+        }
+
+    def gravar_resumo_json(self, caminho):
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(self.resumo(), f, ensure_ascii=False, indent=2)
+
+    def iniciar_servidor(self, porta):
+        """Endpoint /metrics para o Prometheus, numa thread daemon."""
+        registro = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                corpo = registro.texto_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+        servidor = ThreadingHTTPServer(("0.0.0.0", porta), Handler)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        return servidor
+
+
+# Registro único do processo (compartilhado por todas as threads de worker)
+metricas = Metricas()